@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20150901
-# version update    : 20160808
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : Start program with this file
 # notes             : 
@@ -116,6 +116,8 @@ def main():
     main_gui.Show(True)
 
     wxapp.MainLoop()
+
+    module_handler.flowing.close()
     
     return 0
 
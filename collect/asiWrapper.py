@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen, Scott Longwell
 # date              : 20170808
-# version update    : 20170808
+# version update    : 20261018
 # version           : v0.1.0
 # usage             : Use as module
 # notes             : General functions wrapper for collect control. Must be the same for all collect control hardware!
@@ -30,6 +30,9 @@ import re
 from IPy import IP
 #import gclib
 from serial import Serial
+# Project
+import hware
+import collectQueue
 
 # [CONSTANTS]
 # Galil counts to mm conversion --> Move into function
@@ -40,6 +43,11 @@ MAX_SPEED = 8.6
 CONTROLLER = "ASI MS-2000"
 BAUD_RATE = 115200
 TEMRINATOR = "\r"
+REPLY_TERMINATOR = b"\r\n"  # MS-2000 replies end with carriage return and line feed
+
+# [SETTINGS]
+COMMAND_TIMEOUT = 1.0  # Seconds to wait for a complete reply
+READ_SLICE = 0.05  # Serial read timeout, the deadline is checked at least this often
 
 class Load(object):
     """ASI Fraction Collector wrapper for Microfluidics Control
@@ -55,7 +63,9 @@ class Load(object):
         self._status = None
         self._output = None
         self._position = None
+        self._last_motion = float('-inf')
         self._client = Serial()
+        self._queue = collectQueue.Executor(name=port)  # Only thread using the serial line
 
     def __repr__(self):
         """Returns client of the collect controller.
@@ -77,6 +87,12 @@ class Load(object):
     def output(self):
         return self._output
     
+    @property
+    def last_motion(self):
+        """Returns the hware.clock() time of the last motion command.
+        """
+        return self._last_motion
+
     @property
     def position(self, value=None):
         if value is not None:
@@ -90,6 +106,7 @@ class Load(object):
             #try:
             self._client.baudrate = BAUD_RATE
             self._client.port = self._port
+            self._client.timeout = READ_SLICE
             self._client.open()
             self._status = True
             print("ASI Connected: %s"%self._port)
@@ -102,6 +119,8 @@ class Load(object):
             self._command('2H MC X+ Y+')
 
     def close(self):
+        # Queued and running commands finish before the connection closes
+        self._queue.close()
         try:
             self._output = self._client.close()
             print('Collect hardware connection closed.')
@@ -116,32 +135,47 @@ class Load(object):
         #except IOError:
         #   print("Colector returned error: %s " % self._output)
 
-    def _read(self):
-        time.sleep(0.05)
-        buffer_bytes = self._client.inWaiting()
-        buffer_string = self._client.read(buffer_bytes).decode('utf-8')
+    def _read(self, timeout=COMMAND_TIMEOUT):
+        """Read one reply up to the reply terminator; returns as soon as it is complete.
+        """
+        deadline = hware.clock() + timeout
+        buffer_bytes = b''
+        while not buffer_bytes.endswith(REPLY_TERMINATOR):
+            if hware.clock() > deadline:
+                raise IOError('%s reply timed out after %0.2f s: %r' % (CONTROLLER, timeout, buffer_bytes))
+            # Blocks until at least one byte arrived or READ_SLICE passed
+            buffer_bytes += self._client.read(max(1, self._client.inWaiting()))
+        buffer_string = buffer_bytes[:-len(REPLY_TERMINATOR)].decode('utf-8')
         #print("ASI out: %s"%buffer_string)
         return buffer_string
 
+    def _transact(self, string, timeout=COMMAND_TIMEOUT):
+        """Send a command and return its reply, discarding stale input first.
+        """
+        self._client.flushInput()
+        self._write(string)
+        return self._read(timeout)
+
+    def _submit(self, string, priority=collectQueue.MOVE, timeout=COMMAND_TIMEOUT):
+        """Queue a command on the command thread; returns a Future of the reply.
+        """
+        return self._queue.submit(priority, self._transact, string, timeout)
+
+    def _query(self, string, priority=collectQueue.STATUS, timeout=COMMAND_TIMEOUT):
+        return self._queue.call(priority, self._transact, string, timeout)
+
     def _busy(self):
-        self._write('2H STATUS')
-        if 'B' in self._read():
+        if 'B' in self._query('2H STATUS'):
             return True
         else:
             return False
 
-    def _command(self, string, wait=True):
+    def _command(self, string, wait=True, priority=collectQueue.MOVE, timeout=COMMAND_TIMEOUT):
         #try:
-        busy=True
-        while (self._busy() is True) and (wait is True):
-            if busy is True:
-                print("Fraction collector busy...")
-                busy=False
-            time.sleep(0.1)
-        self._client.flush()
-        self._write(string)
-        #time.sleep(0.05)
-        self._output = self._read()
+        if wait is True and self._busy() is True:
+            print("Fraction collector busy...")
+            self.wait_idle()
+        self._output = self._query(string, priority, timeout)
         return self._output
         #except IOError:
         #    print("Colector returned error: %s " % self._output)
@@ -157,31 +191,39 @@ class Load(object):
     # Minimum functions
     def stop(self):
         print('HALT')
-        self._command('2H HALT', wait=False)
+        self._command('2H HALT', wait=False, priority=collectQueue.STOP)
+
+    def wait_idle(self, timeout=None, poll=collectQueue.IDLE_POLL):
+        """Wait until the stage stopped moving, checking every poll seconds.
+        """
+        collectQueue.wait_idle(self._busy, poll, timeout)
 
     def homing(self):
         """Stage homing.
         """
+        self._last_motion = hware.clock()
         self._command('2H HOME X Y')
         print('Homing ...')
 
-    def update_position(self):
-        """Update current position.
+    def update_position(self, wait=True):
+        """Update current position of both axes with one command.
+
+        Positions are read while moving. With wait=False nothing is read and
+        False is returned if other commands are queued.
         """
-        out = self._command('2H W X')        
-        try:
-            outx = float(re.search(r"\d+.\d{1}", out).group())
-            x_conv = float(outx)/X_MM    
-        except:
-            x_conv = 0
-        out = self._command('2H W Y')
+        if wait is False and not self._queue.idle:
+            return False
+        out = self._query('2H W X Y')
         try:
-            outy = float(re.search(r"\d+.\d{1}", out).group())
-            y_conv = float(outy)/Y_MM
-        except:
-            y_conv = 0
+            outx, outy = [float(value) for value in re.findall(r"-?\d+(?:\.\d+)?", out)[-2:]]
+        except ValueError:
+            warnings.warn('Could not read %s position: %s' % (CONTROLLER, out))
+            return False
+        x_conv = outx/X_MM
+        y_conv = outy/Y_MM
         #print( 'Current position is: ' + str(x_conv) + ' mm, ' + str(y_conv) + ' mm')
         self._position =  {'x':x_conv, 'y':y_conv}
+        return True
 
     def set_home(self):
         """Set current position as home position.
@@ -189,8 +231,8 @@ class Load(object):
         print("Setting home position.")
         self._command('2H HERE X Y')
 
-    def move_abs(self, x, y):
-        """Move absolute in mm.
+    def move_abs(self, x, y, wait=True):
+        """Move absolute in mm; with wait=False returns without waiting for the move.
         """
         if x != 0:
             x_conv = str(float(x)* X_MM)
@@ -200,29 +242,34 @@ class Load(object):
             y_conv = str(float(y)* Y_MM)
         else:
             y_conv = str(0)
+        self._last_motion = hware.clock()
         self._command('2H M X='+x_conv+' Y='+y_conv)
-        while self._busy() is True:
-            time.sleep(0.2)
+        if wait is False:
+            return
+        self.wait_idle()
         self.update_position()
         print("Moved absolute position: %0.1f, %0.1f" % (self._position['x'],self._position['y']))
 
-    def home(self):
+    def home(self, wait=True):
         """Go to home position.
         """
-        out = self.move_abs(0,0)
-        while self._busy() is True:
-            time.sleep(0.2)
+        out = self.move_abs(0,0, wait=False)
+        if wait is False:
+            return
+        self.wait_idle()
         self.update_position()
         print("Moved home position: %0.1f mm, %0.1f mm" % (self._position['x'],self._position['y']))
 
-    def move_rel(self, x, y):
-        """Move relative in mm.
+    def move_rel(self, x, y, wait=True):
+        """Move relative in mm; with wait=False returns without waiting for the move.
         """
         x_conv = str(float(x)* X_MM)
         y_conv = str(float(y)* Y_MM)
+        self._last_motion = hware.clock()
         self._command('2H R X='+x_conv+' Y=' + y_conv)
-        while self._busy() is True:
-            time.sleep(0.2)
+        if wait is False:
+            return
+        self.wait_idle()
         self.update_position()
         print("Moved relative position: %0.1f mm, %0.1f mm" % (self._position['x'],self._position['y']))
 
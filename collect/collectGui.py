@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20160308
-# version update    : 20161207
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : As module
 # notes             : Do not quick fix functions for specific needs, keep them general!
@@ -31,9 +31,13 @@ import wx
 from wx.lib.masked import NumCtrl
 # Project
 import config
+import hware
+import collectPlate
 
 # [SETTINGS]
-POS_READ_TIME = 0.5  # Refresh time in seconds for pressure read
+POS_FAST_TIME = 0.1  # Refresh time in seconds for position read while moving
+POS_IDLE_TIME = 2.0  # Refresh time in seconds for position read while idle
+MOTION_TIME = 1.0  # Seconds after a motion command or position change that count as moving
 
 class MainWindow(wx.Frame):
     """This is the main window for the Flow Module of the Microfluidic Control program.
@@ -91,47 +95,111 @@ class Tubes(wx.Panel):
         super(Tubes, self).__init__(parent)
         # Parameters
         self.parent = parent
+        self.plate_type = None  # Plate as stored in plateConfig.json
+        self.plate = None  # Plate in use, resized if rows or columns differ from the type
 
         tubeBox = wx.StaticBox(self, -1, "Plate settings")
 
         mainSizer = wx.StaticBoxSizer(tubeBox, wx.VERTICAL)
+        level0Sizer = wx.BoxSizer(wx.HORIZONTAL)
         level1Sizer = wx.BoxSizer(wx.HORIZONTAL)
         level2Sizer = wx.BoxSizer(wx.HORIZONTAL)
 
+        plate_types = collectPlate.plate_types()
+        self.comboPlate = wx.ComboBox(self, choices=plate_types, style=wx.CB_READONLY, size=(-1,25))
+        self.comboPlate.Bind(wx.EVT_COMBOBOX, self.plate_change)
+        level0Sizer.Add(self.comboPlate, 1, wx.ALL|wx.ALIGN_CENTER, 2)
+        calibrateTube = wx.Button(self, name='calibrateTube', label='Calibrate', style=wx.TR_SINGLE)
+        calibrateTube.Bind(wx.EVT_BUTTON, self.calibrate_tube)
+        level0Sizer.Add(calibrateTube, 0, wx.ALL|wx.ALIGN_CENTER, 2)
+        mainSizer.Add(level0Sizer, 1, wx.ALL|wx.ALIGN_CENTER|wx.EXPAND, 5)
+
         labelTube = wx.Button(self, name='labelTube', label='Go to tube #:', style=wx.TR_SINGLE)
         labelTube.Bind(wx.EVT_BUTTON, self.goto_tube)
         level1Sizer.Add(labelTube, 1, wx.RIGHT|wx.ALIGN_CENTER, 2)
-        self.tubeNo = NumCtrl(self, name = 'gotoTube', value = 1, integerWidth = 2, allowNegative = False, min = 1, max = 99, 
-                                fractionWidth = 0, groupDigits = False, autoSize = False, style = wx.TR_SINGLE|wx.CENTER, size = (29,-1))
+        self.tubeNo = NumCtrl(self, name = 'gotoTube', value = 1, integerWidth = 3, allowNegative = False, min = 1, max = 999, 
+                                fractionWidth = 0, groupDigits = False, autoSize = False, style = wx.TR_SINGLE|wx.CENTER, size = (36,-1))
         level1Sizer.Add(self.tubeNo, 1, wx.ALL|wx.ALIGN_CENTER, 2)
+        self.tubeLabel = wx.StaticText(self, label='', size=(30,-1), style=wx.TR_SINGLE)
+        level1Sizer.Add(self.tubeLabel, 1, wx.ALL|wx.ALIGN_CENTER, 2)
         mainSizer.Add(level1Sizer, 1, wx.ALL|wx.ALIGN_CENTER, 5)
         
         label_row = wx.StaticText(self, label='Rows', style=wx.TR_SINGLE)
         level2Sizer.Add(label_row, 2, wx.ALL|wx.ALIGN_CENTER, 2)
-        self.tube_rows = NumCtrl(self, name = 'rowsTube', value = 12, integerWidth = 2, allowNegative = False, min = 1, max = 99, 
+        self.tube_rows = NumCtrl(self, name = 'rowsTube', value = 8, integerWidth = 2, allowNegative = False, min = 1, max = 99, 
                                 fractionWidth = 0, groupDigits = False, autoSize = False, style = wx.TR_SINGLE|wx.CENTER, size = (29,-1))
         level2Sizer.Add(self.tube_rows, 1, wx.ALL|wx.ALIGN_CENTER, 2)
         label_row = wx.StaticText(self, label='Columns', style=wx.TR_SINGLE)
         level2Sizer.Add(label_row, 2, wx.ALL|wx.ALIGN_CENTER, 2)
-        self.tube_cols = NumCtrl(self, name = 'colsTube', value = 8, integerWidth = 2, allowNegative = False, min = 1, max = 99, 
+        self.tube_cols = NumCtrl(self, name = 'colsTube', value = 12, integerWidth = 2, allowNegative = False, min = 1, max = 99, 
                                 fractionWidth = 0, groupDigits = False, autoSize = False, style = wx.TR_SINGLE|wx.CENTER, size = (29,-1))
         level2Sizer.Add(self.tube_cols, 1, wx.ALL|wx.ALIGN_CENTER, 2)
         mainSizer.Add(level2Sizer, 1, wx.ALL|wx.ALIGN_CENTER, 5)
         
         self.SetSizer(mainSizer)
 
-    def goto_tube(self, event):
+        if plate_types:
+            if collectPlate.PLATE_DEFAULT in plate_types:
+                self.comboPlate.SetValue(collectPlate.PLATE_DEFAULT)
+            else:
+                self.comboPlate.SetValue(plate_types[0])
+            self.plate_change(None)
+
+    def plate_change(self, event):
+        self.plate_type = collectPlate.load(self.comboPlate.GetValue())
+        self.plate = self.plate_type
+        self.tube_rows.SetValue(self.plate.rows)
+        self.tube_cols.SetValue(self.plate.columns)
+
+    def current_plate(self):
+        """Returns the selected plate, resized to the rows and columns set.
+
+        A resized plate is not calibrated, as calibration points belong to
+        the layout of the plate type, and is never saved.
+        """
         rows = self.tube_rows.GetValue()
         cols = self.tube_cols.GetValue()
-        tube = self.tubeNo.GetValue()-1
-        if (tube+1 > rows*cols) or (tube < 0):
+        if self.plate_type is None:
+            return None
+        if (rows, cols) == (self.plate_type.rows, self.plate_type.columns):
+            self.plate = self.plate_type
+        elif (rows, cols) != (self.plate.rows, self.plate.columns):
+            self.plate = collectPlate.load(self.plate_type.name, rows=rows, columns=cols, calibration=None)
+            if self.plate_type.calibration:
+                warnings.warn("Calibration of %s not used for %d rows x %d columns; positions are uncalibrated." % (self.plate_type.name, rows, cols))
+        return self.plate
+
+    def goto_tube(self, event):
+        plate = self.current_plate()
+        tube = self.tubeNo.GetValue()
+        if plate is None or not 1 <= tube <= len(plate):
             return
-        incX = self.parent.pos_param.setIncrementX.GetValue()
-        incY = self.parent.pos_param.setIncrementY.GetValue()
-        cols_step = int(tube/rows)
-        rows_step = tube - (cols_step * rows)
-        print(cols_step, rows_step)
-        self.parent.control.move_abs(-rows_step*incX, cols_step*incY)
+        x, y = plate.position(tube)
+        self.tubeLabel.SetLabel(plate.label(tube))
+        self.parent.control.move_abs(x, y, wait=False)
+
+    def calibrate_tube(self, event):
+        """Use the current stage position as position of the tube # and save the plate calibration.
+        """
+        plate = self.current_plate()
+        tube = self.tubeNo.GetValue()
+        if plate is None or not 1 <= tube <= len(plate):
+            return
+        if plate is not self.plate_type:
+            warnings.warn("Plate calibration refused: rows and columns differ from %s. Reset them or add a plate type to plateConfig.json." % self.plate_type.name)
+            return
+        if not self.parent.control.update_position():
+            warnings.warn("Plate calibration aborted: could not read the stage position.")
+            return
+        points = plate.calibration
+        points[tube] = [self.parent.control.position['x'], self.parent.control.position['y']]
+        try:
+            residual = plate.calibrate(points)
+        except ValueError as e:
+            warnings.warn("Plate calibration failed: %s" % e)
+            return
+        collectPlate.save(plate)
+        print("Calibrated %s with %d points, residual %0.3f mm" % (plate.name, len(points), residual))
         
 
 class PositionParameters(wx.Panel):
@@ -255,27 +323,32 @@ class DirectionRose(wx.Panel):
         o = event.GetEventObject()
         name = o.GetName()
         if name == "lu":
-            self.parent.control.move_rel(-incX, -incY)
+            self.parent.control.move_rel(-incX, -incY, wait=False)
         elif name == "mu":
-            self.parent.control.move_rel(-incX, 0)
+            self.parent.control.move_rel(-incX, 0, wait=False)
         elif name == "ru":
-            self.parent.control.move_rel(-incX, incY)
+            self.parent.control.move_rel(-incX, incY, wait=False)
         elif name == "ll":
-            self.parent.control.move_rel(0, -incY)
+            self.parent.control.move_rel(0, -incY, wait=False)
         elif name == "xx":
-            self.parent.control.home()
+            self.parent.control.home(wait=False)
         elif name == "rr":
-            self.parent.control.move_rel(0, incY)
+            self.parent.control.move_rel(0, incY, wait=False)
         elif name == "ld":
-            self.parent.control.move_rel(incX, -incY)
+            self.parent.control.move_rel(incX, -incY, wait=False)
         elif name == "md":
-            self.parent.control.move_rel(incX, 0)
+            self.parent.control.move_rel(incX, 0, wait=False)
         elif name == "rd":
-            self.parent.control.move_rel(incX, incY)
+            self.parent.control.move_rel(incX, incY, wait=False)
         
 
 class PositionRead(threading.Thread):
-    """Pressure read thread.
+    """Position read thread.
+
+    Reads the position every POS_FAST_TIME while the stage moves, that is
+    shortly after a motion command or a position change, and every
+    POS_IDLE_TIME otherwise. A read is skipped while other commands are
+    queued, so polling never delays commands.
     """
     def __init__(self, parent, control):
         threading.Thread.__init__(self)
@@ -301,11 +374,29 @@ class PositionRead(threading.Thread):
     def run(self):
         """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
         """
+        last_read = float('-inf')
+        last_change = float('-inf')
+        position = None
         while self.halt is False:
-            self.control.update_position()
-            time.sleep(POS_READ_TIME)
-            try: 
-                self.parent.pos_param.positionX.SetLabel("%.1f" %self.control.position['x'])
-                self.parent.pos_param.positionY.SetLabel("%.1f" %self.control.position['y'])
-            except: 
-                warnings.warn("Collect position update failed.")
+            time_now = hware.clock()
+            moving = time_now - max(self.control.last_motion, last_change) < MOTION_TIME
+            if time_now - last_read >= (POS_FAST_TIME if moving else POS_IDLE_TIME):
+                try:
+                    updated = self.control.update_position(wait=False)
+                except IOError as e:
+                    warnings.warn("Collect position read failed: %s" % e)
+                    updated = False
+                if updated:
+                    last_read = time_now
+                    if self.control.position != position:
+                        position = self.control.position
+                        last_change = time_now
+                        wx.CallAfter(self.show_position, position)
+            self._stop.wait(POS_FAST_TIME)
+
+    def show_position(self, position):
+        try:
+            self.parent.pos_param.positionX.SetLabel("%.1f" % position['x'])
+            self.parent.pos_param.positionY.SetLabel("%.1f" % position['y'])
+        except:
+            warnings.warn("Collect position update failed.")
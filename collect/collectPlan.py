@@ -0,0 +1,290 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : collectPlan.py
+# description       : Microfluidic Control - Collect module - Tube visit order planner
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen, Scott Longwell
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.1.0
+# usage             : route = collectPlan.plan(plate, tubes, control.get_speed(), start); route.run(control)
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+"""
+Plans the order in which a collection run visits tubes.
+
+Both stage axes move at the same time, so a move takes as long as its
+slowest axis: max(|dx|/vx, |dy|/vy). The route starts with the nearest
+allowed tube at every step and is then improved with 2-opt segment
+reversals until no reversal saves time. Ordering constraints (tube a
+before tube b) are kept in both steps.
+"""
+
+# [Modules]
+# General Python
+import warnings
+# Data
+import numpy as np
+# Project
+import hware
+
+# [SETTINGS]
+MOVE_OVERHEAD = 0.0  # Seconds added to every move for command round trips, acceleration and settling; see Route.report 'offset'
+TIME_POLL = 0.01  # Seconds between busy polls while timing a move
+MIN_GAIN = 1e-6  # Seconds a 2-opt reversal must save
+
+def move_time(start, end, speed, overhead=MOVE_OVERHEAD):
+    """Returns the time in seconds to move between two stage positions (x, y) in mm.
+
+    Parameters
+    ----------
+    speed : float or list
+        Speed in mm/s of both axes, or of x and y, as set on the controller.
+    """
+    vx, vy = _speeds(speed)
+    return max(abs(end[0]-start[0])/vx, abs(end[1]-start[1])/vy) + overhead
+
+def _speeds(speed):
+    if np.isscalar(speed):
+        return float(speed), float(speed)
+    return float(speed[0]), float(speed[1])
+
+def _time_matrix(points, speed, overhead):
+    vx, vy = _speeds(speed)
+    dx = np.abs(points[:, 0, np.newaxis] - points[np.newaxis, :, 0]) / vx
+    dy = np.abs(points[:, 1, np.newaxis] - points[np.newaxis, :, 1]) / vy
+    times = np.maximum(dx, dy) + overhead
+    np.fill_diagonal(times, 0)
+    return times
+
+def _nearest_neighbour(times, before):
+    """Returns the visit order of nodes 1..n-2 from node 0, nearest allowed node first.
+    """
+    node_num = len(times)
+    visited = np.zeros(node_num, dtype=bool)
+    visited[[0, node_num-1]] = True
+    waiting = np.array([len(nodes) for nodes in before])
+    after = [[] for _ in xrange(node_num)]
+    for node, nodes in enumerate(before):
+        for first in nodes:
+            after[first].append(node)
+    path = [0]
+    for _ in xrange(node_num-2):
+        allowed = ~visited & (waiting == 0)
+        if not allowed.any():
+            raise ValueError('Ordering constraints contain a cycle.')
+        candidates = np.flatnonzero(allowed)
+        node = candidates[np.argmin(times[path[-1], candidates])]
+        visited[node] = True
+        for later in after[node]:
+            waiting[later] -= 1
+        path.append(node)
+    path.append(node_num-1)
+    return np.array(path)
+
+def _two_opt(path, times, constraints):
+    """Reverse path segments while that saves time; keeps the first and last node.
+
+    A reversal keeps the constraints if no constraint has both tubes inside
+    the segment.
+    """
+    path = path.copy()
+    node_num = len(path)
+    improved = True
+    while improved:
+        improved = False
+        position = np.empty(node_num, dtype=int)
+        position[path] = np.arange(node_num)
+        for i in xrange(1, node_num-2):
+            # Segment path[i..j] may end before the first constrained later tube
+            limit = node_num - 2
+            for first, then in constraints:
+                if position[first] >= i:
+                    limit = min(limit, position[then] - 1)
+            if limit <= i:
+                continue
+            js = np.arange(i+1, limit+1)
+            a, b = path[i-1], path[i]
+            c, d = path[js], path[js+1]
+            gain = times[a, b] + times[c, d] - times[a, c] - times[b, d]
+            best = np.argmax(gain)
+            if gain[best] > MIN_GAIN:
+                j = js[best]
+                path[i:j+1] = path[i:j+1][::-1].copy()
+                position[path[i:j+1]] = np.arange(i, j+1)
+                improved = True
+    return path
+
+def plan(plate, tubes, speed, start=None, constraints=None, overhead=MOVE_OVERHEAD):
+    """Plan a near-minimal-time visit order of tubes.
+
+    Parameters
+    ----------
+    plate : collectPlate.Plate
+        Plate with the tube positions.
+
+    tubes : list
+        Tube numbers to visit, each once.
+
+    speed : float or list
+        Speed in mm/s of both axes, or of x and y, as set on the
+        controller: control.get_speed().
+
+    start : list, optional
+        Stage position (x, y) in mm at the start; any first tube by default.
+
+    constraints : list, optional
+        Pairs (first, then) of tube numbers: first is visited before then.
+
+    overhead : float
+        Seconds added to every move.
+
+    Returns
+    -------
+    route : Route
+    """
+    tubes = [int(tube) for tube in tubes]
+    if len(set(tubes)) != len(tubes):
+        raise ValueError('Tubes must be visited once: %s' % tubes)
+    # Node 0 is the start and the last node the end; both have no move time if free
+    node = dict((tube, index+1) for index, tube in enumerate(tubes))
+    points = np.array([plate.position(tube) for tube in tubes]).reshape(-1, 2)
+    node_num = len(tubes) + 2
+    times = np.zeros((node_num, node_num))
+    times[1:-1, 1:-1] = _time_matrix(points, speed, overhead)
+    if start is not None:
+        times[0, 1:-1] = _time_matrix(np.vstack([start, points]), speed, overhead)[0, 1:]
+        times[1:-1, 0] = times[0, 1:-1]
+    pairs = []
+    before = [[] for _ in xrange(node_num)]
+    for first, then in constraints or []:
+        if first not in node or then not in node:
+            raise ValueError('Constrained tubes must be in the tubes to visit: %s, %s' % (first, then))
+        pairs.append((node[first], node[then]))
+        before[node[then]].append(node[first])
+    path = _nearest_neighbour(times, before)
+    path = _two_opt(path, times, pairs)
+    order = [tubes[index-1] for index in path[1:-1]]
+    return Route(plate, order, speed, start, overhead)
+
+class Route(object):
+    """Tube visit order with predicted and measured move times.
+
+    Parameters
+    ----------
+    plate : collectPlate.Plate
+        Plate with the tube positions.
+
+    tubes : list
+        Tube numbers in visit order.
+
+    speed : float or list
+        Speed in mm/s of both axes, or of x and y; run() uses the speed set
+        on the controller.
+
+    start : list, optional
+        Stage position (x, y) in mm at the start.
+
+    overhead : float
+        Seconds added to every move.
+    """
+    def __init__(self, plate, tubes, speed, start=None, overhead=MOVE_OVERHEAD):
+        self.plate = plate
+        self.tubes = list(tubes)
+        self.start = start
+        self.speed = speed
+        self.overhead = overhead
+        self.actual = []
+
+    def __repr__(self):
+        return repr(['Route', self.plate.name, len(self.tubes), '%0.1f s' % self.predicted])
+
+    def __len__(self):
+        return len(self.tubes)
+
+    @property
+    def times(self):
+        """Returns the predicted time in seconds of every move, the first from start if set.
+        """
+        positions = [self.plate.position(tube) for tube in self.tubes]
+        if self.start is not None:
+            positions = [tuple(self.start)] + positions
+        return [move_time(start, end, self.speed, self.overhead)
+                for start, end in zip(positions[:-1], positions[1:])]
+
+    @property
+    def predicted(self):
+        """Returns the predicted total move time in seconds.
+        """
+        return sum(self.times)
+
+    def run(self, control, action=None):
+        """Visit the tubes in order and measure every move.
+
+        Parameters
+        ----------
+        control : object
+            Collect hardware wrapper, like asiWrapper.Load.
+
+        action : function, optional
+            Called with the tube number at every tube, like a dispense.
+
+        Returns
+        -------
+        report : dict
+            Predicted and actual move times in seconds.
+        """
+        speed = control.get_speed()
+        if speed > 0:
+            self.speed = speed
+        else:
+            warnings.warn('Could not read the controller speed, predicting at %s mm/s.' % (self.speed,))
+        if self.start is None:
+            control.update_position()
+            self.start = (control.position['x'], control.position['y'])
+        self.actual = []
+        for tube in self.tubes:
+            x, y = self.plate.position(tube)
+            control.wait_idle()
+            # Timed from sending the move to the first poll that finds the stage idle
+            time_start = hware.clock()
+            control.move_abs(x, y, wait=False)
+            control.wait_idle(poll=TIME_POLL)
+            self.actual.append(hware.clock() - time_start)
+            if action is not None:
+                action(tube)
+        report = self.report()
+        if self.actual:
+            print("Route of %d tubes: predicted %0.1f s, actual %0.1f s, offset %0.2f s per move"
+                  % (len(self), report['predicted'], report['actual'], report['offset']))
+        return report
+
+    def report(self):
+        """Returns the predicted and, after run, actual move times in seconds.
+
+        'offset' is the mean actual minus predicted time per move, the time
+        the prediction misses per move; use it to set MOVE_OVERHEAD.
+        """
+        times = self.times
+        report = {'tubes': self.tubes,
+                  'predicted': sum(times),
+                  'predicted_moves': times,
+                  'actual': None,
+                  'actual_moves': None,
+                  'offset': None}
+        if self.actual:
+            if len(self.actual) != len(times):
+                warnings.warn('Route run was incomplete: %d of %d moves.' % (len(self.actual), len(times)))
+            report['actual'] = sum(self.actual)
+            report['actual_moves'] = list(self.actual)
+            moves = min(len(self.actual), len(times))
+            report['offset'] = (sum(self.actual[:moves]) - sum(times[:moves])) / moves
+        return report
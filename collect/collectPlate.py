@@ -0,0 +1,281 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : collectPlate.py
+# description       : Microfluidic Control - Collect module - Plate geometry
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen, Scott Longwell
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.1.0
+# usage             : As module, plate types in collect/plateConfig.json
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+"""
+Plates map tube numbers to stage positions in mm.
+
+A well in row r and column c has the nominal position (c*pitch_x, r*pitch_y)
+on the plate, with A1 at zero. An affine transform maps nominal positions to
+the stage: origin, direction and skew by default, or the least squares fit of
+measured calibration points. Positions of all tubes are computed once, so a
+move to a tube is a table lookup.
+"""
+
+# [Modules]
+# General Python
+import math
+import string
+# Data
+import numpy as np
+# Project
+import config
+
+# [SETTINGS]
+PLATE_FOLDER = 'collect'
+PLATE_FILE = 'plateConfig.json'
+PLATE_DEFAULT = 'plate-96'
+ORDERS = ('row', 'column')  # Index that runs first when numbering tubes: along a row or down a column
+
+def plate_types():
+    """Returns the names of the plate types in plateConfig.json.
+    """
+    plates = config.FileLoad(PLATE_FOLDER, PLATE_FILE)
+    return [name for name in plates.keys if not name.startswith('_')]
+
+def load(name, **settings):
+    """Returns the Plate of a plate type in plateConfig.json.
+
+    Parameters
+    ----------
+    name : str
+        Plate type.
+
+    settings : dict
+        Plate settings that replace the ones of the plate type.
+    """
+    plates = config.FileLoad(PLATE_FOLDER, PLATE_FILE)
+    plate_settings = dict(plates[name])
+    plate_settings.update(settings)
+    return Plate(name=name, **plate_settings)
+
+def save(plate):
+    """Write the settings and calibration of a plate to plateConfig.json.
+    """
+    plates = config.FileLoad(PLATE_FOLDER, PLATE_FILE)
+    plates[plate.name] = plate.settings
+    plates.update()
+
+class Plate(object):
+    """Plate or rack geometry with precomputed tube positions.
+
+    Parameters
+    ----------
+    rows, columns : int
+        Number of rows and columns.
+
+    pitch : list
+        Distance in mm between columns (x) and between rows (y).
+
+    origin : list
+        Stage position in mm of the first well, A1.
+
+    direction : list
+        Sign of the stage x and y axis along columns and rows.
+
+    skew : float
+        Rotation in degrees of the plate rows relative to the stage x axis.
+
+    order : str
+        'row' numbers tubes along a row first, 'column' down a column first.
+
+    serpentine : bool
+        Reverse every other row (or column), so consecutive tubes are neighbours.
+
+    calibration : dict, optional
+        Measured stage positions in mm by tube number; replaces origin,
+        direction and skew with the fitted transform.
+
+    name : str, optional
+        Plate type.
+    """
+    def __init__(self, rows, columns, pitch, origin=(0, 0), direction=(1, 1), skew=0.0,
+                 order='row', serpentine=False, calibration=None, name=None):
+        if order not in ORDERS:
+            raise ValueError('Plate order must be one of %s: %s' % (ORDERS, order))
+        self.name = name
+        self.rows = int(rows)
+        self.columns = int(columns)
+        self.pitch = [float(value) for value in pitch]
+        self.origin = [float(value) for value in origin]
+        self.direction = [int(value) for value in direction]
+        self.skew = float(skew)
+        self.order = order
+        self.serpentine = bool(serpentine)
+        self._wells = self._numbering()
+        self._nominal = self._wells[:, ::-1] * np.array(self.pitch)
+        self._numbers = np.zeros((self.rows, self.columns), dtype=int)
+        self._numbers[self._wells[:, 0], self._wells[:, 1]] = np.arange(1, len(self._wells)+1)
+        self._calibration = {}
+        self._affine = self._default_affine()
+        if calibration:
+            self.calibrate(calibration)
+        else:
+            self._update()
+
+    def __repr__(self):
+        return repr(['Plate', self.name, self.rows, self.columns, self.order])
+
+    def __len__(self):
+        return self.rows * self.columns
+
+    def _numbering(self):
+        """Returns (row, column) of every tube in tube number order.
+        """
+        if self.order == 'row':
+            outer, inner = self.rows, self.columns
+        else:
+            outer, inner = self.columns, self.rows
+        wells = []
+        for i in xrange(outer):
+            steps = xrange(inner)
+            if self.serpentine and i % 2:
+                steps = reversed(steps)
+            for j in steps:
+                wells.append((i, j) if self.order == 'row' else (j, i))
+        return np.array(wells, dtype=int)
+
+    def _default_affine(self):
+        angle = math.radians(self.skew)
+        rotation = np.array([[math.cos(angle), -math.sin(angle)],
+                             [math.sin(angle), math.cos(angle)]])
+        linear = rotation.dot(np.diag(self.direction))
+        return np.hstack([linear, np.array(self.origin).reshape(2, 1)])
+
+    def _update(self):
+        self._table = self._nominal.dot(self._affine[:, :2].T) + self._affine[:, 2]
+        self._table.flags.writeable = False
+
+    def _check(self, tube):
+        if not 1 <= tube <= len(self):
+            raise IndexError('Tube %s not on %s, tubes 1 to %d.' % (tube, self.name, len(self)))
+
+    @property
+    def positions(self):
+        """Returns the stage positions in mm of all tubes, tube number order.
+        """
+        return self._table
+
+    @property
+    def affine(self):
+        """Returns the 2x3 transform from nominal plate positions to stage positions.
+        """
+        return self._affine.copy()
+
+    @property
+    def calibration(self):
+        return dict(self._calibration)
+
+    @property
+    def settings(self):
+        """Returns the settings to recreate the plate, as in plateConfig.json.
+        """
+        return {'rows': self.rows,
+                'columns': self.columns,
+                'pitch': self.pitch,
+                'origin': self.origin,
+                'direction': self.direction,
+                'skew': self.skew,
+                'order': self.order,
+                'serpentine': self.serpentine,
+                'calibration': dict((str(tube), list(point)) for tube, point in sorted(self._calibration.items()))}
+
+    def position(self, tube):
+        """Returns the stage position (x, y) in mm of a tube number (1-based).
+        """
+        self._check(tube)
+        x, y = self._table[tube-1]
+        return float(x), float(y)
+
+    def well(self, tube):
+        """Returns the row and column (0-based) of a tube number.
+        """
+        self._check(tube)
+        row, column = self._wells[tube-1]
+        return int(row), int(column)
+
+    def label(self, tube):
+        """Returns the well name of a tube number, like 'A1'.
+        """
+        row, column = self.well(tube)
+        letters = string.ascii_uppercase
+        prefix = letters[row // len(letters) - 1] if row >= len(letters) else ''
+        return '%s%s%d' % (prefix, letters[row % len(letters)], column + 1)
+
+    def tube(self, row, column):
+        """Returns the tube number of a row and column (0-based).
+        """
+        return int(self._numbers[row, column])
+
+    def calibrate(self, points):
+        """Fit the stage transform to measured tube positions.
+
+        One point shifts the plate, two points also fit rotation and scale,
+        three or more fit a full affine transform (skew and shear) by least
+        squares.
+
+        Parameters
+        ----------
+        points : dict
+            Stage position (x, y) in mm by tube number.
+
+        Returns
+        -------
+        residual : float
+            Root mean square distance in mm between measured and fitted positions.
+        """
+        if not points:
+            raise ValueError('Plate calibration needs at least one point.')
+        tubes = sorted(int(tube) for tube in points)
+        for tube in tubes:
+            self._check(tube)
+        measured = np.array([points[tube] if tube in points else points[str(tube)] for tube in tubes], dtype=float)
+        nominal = self._nominal[np.array(tubes) - 1]
+        if len(tubes) == 1:
+            affine = self._default_affine()
+            affine[:, 2] = measured[0] - affine[:, :2].dot(nominal[0])
+        elif len(tubes) == 2:
+            affine = self._fit_similarity(nominal, measured)
+        else:
+            design = np.hstack([nominal, np.ones((len(tubes), 1))])
+            solution, residues, rank, values = np.linalg.lstsq(design, measured, rcond=-1)
+            if rank < 3:
+                raise ValueError('Plate calibration points must not lie on one line: %s' % tubes)
+            affine = solution.T
+        self._affine = affine
+        self._calibration = dict((tube, [float(x), float(y)]) for tube, (x, y) in zip(tubes, measured))
+        self._update()
+        fitted = self._table[np.array(tubes) - 1]
+        return float(np.sqrt(np.mean(np.sum((fitted - measured)**2, axis=1))))
+
+    def _fit_similarity(self, nominal, measured):
+        """Returns the rotation, scale and shift that map two nominal points on two measured points.
+        """
+        nominal_step = nominal[1] - nominal[0]
+        measured_step = measured[1] - measured[0]
+        if not np.any(nominal_step):
+            raise ValueError('Plate calibration points must be different tubes.')
+        # Complex division gives rotation and scale; keeps the mirror of direction
+        mirror = np.diag([1, self.direction[0]*self.direction[1]])
+        nominal_step = mirror.dot(nominal_step)
+        ratio = complex(*measured_step) / complex(*nominal_step)
+        linear = np.array([[ratio.real, -ratio.imag],
+                           [ratio.imag, ratio.real]]).dot(mirror)
+        shift = measured[0] - linear.dot(nominal[0])
+        return np.hstack([linear, shift.reshape(2, 1)])
@@ -0,0 +1,150 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : collectQueue.py
+# description       : Microfluidic Control - Collect module - Command executor
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen, Scott Longwell
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.1.0
+# usage             : As module, used by the collect hardware wrappers
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import time
+import warnings
+import itertools
+import threading
+import Queue
+# Project
+import hware
+
+# [CONSTANTS]
+# Command priorities, lower runs first
+STOP = 0
+MOVE = 1
+STATUS = 2
+
+# [SETTINGS]
+IDLE_POLL = 0.1  # Seconds between status polls while waiting for idle
+CLOSE_TIMEOUT = 5.0  # Seconds to wait for queued commands before a connection is closed
+
+class Executor(threading.Thread):
+    """Command thread that owns the connection of one collector.
+
+    Runs one command at a time from a priority queue: stop commands go
+    before queued moves, and moves before status polls. Commands of the
+    same priority run in order. Callers get a hware.Future of the reply.
+
+    Parameters
+    ----------
+    name : str, optional
+        Thread name, like the port.
+    """
+    def __init__(self, name=None):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self._queue = Queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.start()
+
+    @property
+    def pending(self):
+        """Returns the number of queued and running commands.
+        """
+        return self._pending
+
+    @property
+    def idle(self):
+        return self._pending == 0
+
+    def submit(self, priority, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) with priority; returns a Future of its result.
+        """
+        future = hware.Future()
+        with self._lock:
+            self._pending += 1
+            self._queue.put((priority, next(self._order), future, func, args, kwargs))
+        return future
+
+    def call(self, priority, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the executor and wait for its result.
+        """
+        if threading.current_thread() is self:
+            return func(*args, **kwargs)
+        return self.submit(priority, func, *args, **kwargs).result()
+
+    def stop(self):
+        """Stop after the queued commands.
+        """
+        with self._lock:
+            self._queue.put((float('inf'), next(self._order), None, None, None, None))
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Stop after the queued commands and wait for them, before the connection is closed.
+
+        Returns False if commands still run after timeout seconds.
+        """
+        self.stop()
+        if threading.current_thread() is self:
+            return True
+        self.join(timeout)
+        if self.is_alive():
+            warnings.warn('Collector commands still running after %0.1f s.' % timeout)
+            return False
+        return True
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        while True:
+            priority, order, future, func, args, kwargs = self._queue.get()
+            if future is None:
+                break
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            # Idle before the caller wakes up, so a follow-up status read is not skipped
+            with self._lock:
+                self._pending -= 1
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+def wait_idle(busy, poll=IDLE_POLL, timeout=None):
+    """Wait until busy() returns False.
+
+    Waits on the calling thread, so stop commands from other threads are
+    sent in between the polls.
+
+    Parameters
+    ----------
+    busy : function
+        Returns True while the collector moves.
+
+    poll : float
+        Seconds between polls.
+
+    timeout : float, optional
+        Seconds before an IOError is raised, waits forever by default.
+    """
+    deadline = None if timeout is None else hware.clock() + timeout
+    while busy():
+        if deadline is not None and hware.clock() > deadline:
+            raise IOError('Collector still busy after %0.1f s.' % timeout)
+        time.sleep(poll)
@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20150901
-# version update    : 20161208
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : Use as module
 # notes             : General functions wrapper for flow control. Must be the same for all flow control hardware!
@@ -24,10 +24,14 @@ from __future__ import division
 import sys
 import warnings
 import time
+import re
 import thread
 # IO
 from IPy import IP
 import gclib
+# Project
+import hware
+import collectQueue
 
 # [CONSTANTS]
 # Galil counts to mm conversion --> Move into function
@@ -48,7 +52,9 @@ class Load(object):
         self._status = None
         self._output = None
         self._position = None
+        self._last_motion = float('-inf')
         self._client = gclib.py()
+        self._queue = collectQueue.Executor(name=port)  # Only thread using the connection
 
     def __repr__(self):
         """Returns client of the Gallil controller.
@@ -70,6 +76,12 @@ class Load(object):
     def output(self):
         return self._output
     
+    @property
+    def last_motion(self):
+        """Returns the hware.clock() time of the last motion command.
+        """
+        return self._last_motion
+
     @property
     def position(self, value=None):
         if value is not None:
@@ -101,6 +113,8 @@ class Load(object):
             self._command('CN 1, 1')  # Switch on X/Y limit switches high
 
     def close(self):
+        # Queued and running commands finish before the connection closes
+        self._queue.close()
         try:
             self._output = self._client.GClose()
             print('Collect hardware connection closed.')
@@ -108,9 +122,14 @@ class Load(object):
             print('Collect hardware connection error: %s' % self._output)
 
     # Base functions
-    def _command(self, string):
+    def _submit(self, string, priority=collectQueue.MOVE):
+        """Queue a command on the command thread; returns a Future of the reply.
+        """
+        return self._queue.submit(priority, self._client.GCommand, string)
+
+    def _command(self, string, priority=collectQueue.MOVE):
         try:
-            output = self._client.GCommand(string)
+            output = self._queue.call(priority, self._client.GCommand, string)
             self._output = output
             return output
         except gclib.GclibError:
@@ -119,6 +138,13 @@ class Load(object):
             else:
                 print("Gallil returned error: %s " % self.output)
 
+    def _busy(self):
+        out = self._command('MG _BGA + _BGB', collectQueue.STATUS)
+        try:
+            return float(out) != 0
+        except (TypeError, ValueError):
+            raise IOError('Gallil busy state unknown, reply: %s' % out)
+
     def _error_code(self, code):
         """Error code handler
         """
@@ -130,7 +156,12 @@ class Load(object):
     # Minimum functions
     def stop(self):
         print('STOP')
-        self._command('ST')
+        self._command('ST', collectQueue.STOP)
+
+    def wait_idle(self, timeout=None, poll=collectQueue.IDLE_POLL):
+        """Wait until the stage stopped moving, checking every poll seconds.
+        """
+        collectQueue.wait_idle(self._busy, poll, timeout)
 
     def check_limits(self):
         self._command('TC')
@@ -140,22 +171,33 @@ class Load(object):
     def homing(self):
         """Stage homing.
         """
+        self._last_motion = hware.clock()
         self._command('HM')
         print('Homing X-axis...')
         self._command('BGA')
-        sleep(5)
-        print('Homing X-axis')
+        self.wait_idle()
+        print('Homing Y-axis...')
         self._command('BGB')
 
-    def update_position(self):
-        """Update current position.
+    def update_position(self, wait=True):
+        """Update current position of both axes with one command.
+
+        With wait=False nothing is read and False is returned if other
+        commands are queued.
         """
-        outx = self._command('TPA')
-        x_conv = float(outx)/X_MM
-        outy = self._command('TPB')
-        y_conv = float(outy)/Y_MM
+        if wait is False and not self._queue.idle:
+            return False
+        out = self._command('MG _TPA, _TPB', collectQueue.STATUS)
+        try:
+            outx, outy = [float(value) for value in re.findall(r"-?\d+(?:\.\d+)?", out)]
+        except (TypeError, ValueError):
+            warnings.warn('Could not read Galil position: %s' % out)
+            return False
+        x_conv = outx/X_MM
+        y_conv = outy/Y_MM
         #print( 'Current position is: ' + str(x_conv) + ' mm, ' + str(y_conv) + ' mm')
         self._position =  {'x':x_conv, 'y':y_conv}
+        return True
 
     def set_home(self):
         """Set current position as home position.
@@ -163,31 +205,43 @@ class Load(object):
         print("Setting home position.")
         self._command('DP 0,0')
 
-    def move_abs(self, x, y):
-        """Move absolute in mm.
+    def move_abs(self, x, y, wait=True):
+        """Move absolute in mm; with wait=False returns without waiting for the move.
         """
         x_conv = str(float(x)* X_MM)
         y_conv = str(float(y)* Y_MM)
+        self._last_motion = hware.clock()
         self._command('PA ' + x_conv + ',' + y_conv)
         self._command('BG X,Y')
+        if wait is False:
+            return
+        self.wait_idle()
         out = self._command('PA ?,?')
         print("Moved to absolute position: %s" % out)
 
-    def home(self):
+    def home(self, wait=True):
         """Go to home position.
         """
+        self._last_motion = hware.clock()
         self._command('PA 0,0')
         self._command('BG X,Y')
+        if wait is False:
+            return
+        self.wait_idle()
         out = self._command('PA ?,?')
         print("Moved to absolute position: %s" % out)
 
-    def move_rel(self, x, y):
-        """Move relative in mm.
+    def move_rel(self, x, y, wait=True):
+        """Move relative in mm; with wait=False returns without waiting for the move.
         """
         x_conv = str(float(x)* X_MM)
         y_conv = str(float(y)* Y_MM)
+        self._last_motion = hware.clock()
         self._command('PR ' + x_conv + ',' + y_conv)
         self._command('BG X,Y')
+        if wait is False:
+            return
+        self.wait_idle()
         out = self._command('PA ?,?')
         print("Moved to position: %s" % out)
 
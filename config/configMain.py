@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20150915
-# version update    : 20160915
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : Use as main gui window
 # notes             : 
@@ -109,7 +109,7 @@ class FileLoad(object):
             path = os.path.relpath(path)
         else:
             raise IOError('Path not found.')
-        newest_file = max(glob.iglob('.\\' + path + '\\' + pattern), key=os.path.getctime)
+        newest_file = max(glob.iglob(os.path.join('.', path, pattern)), key=os.path.getctime)
         return newest_file
 
     @staticmethod
@@ -0,0 +1,255 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : flowAcquire.py
+# description       : Microfluidic Control - Flow module - Pressure acquisition
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import warnings
+import threading
+# Data
+import numpy as np
+# Project
+import hware
+
+# [SETTINGS]
+ACQUIRE_RATE = 50  # Pressure sweeps per second, set with 'rate' in `flowing` of hwareConfig.json
+BUFFER_TIME = 60  # Seconds of samples kept in the ring buffer
+
+class Acquisition(threading.Thread):
+    """Pressure acquisition thread.
+
+    Sweeps all channels at a fixed rate on an absolute schedule and writes
+    the samples, with the setpoints at the time of the sweep, into a ring
+    buffer. The thread is the only writer: a slot is
+    written before the sample count is advanced, so readers never lock and
+    check the count again after copying to drop samples that were
+    overwritten meanwhile. Consumers read with a Reader at their own rate.
+
+    A failed sweep is counted in `errors`, with the exception in
+    `last_error`, and sampling goes on; no sample is written for it.
+
+    The recorded setpoints are the requested pressures: the targets of the
+    regulator if one is attached, otherwise the setpoints last sent.
+
+    Parameters
+    ----------
+    control : mfcs-ezWrapper.Load
+        Connected flow control with read_sweep().
+
+    rate : float
+        Sweeps per second.
+
+    size : int, optional
+        Ring buffer size in samples, BUFFER_TIME seconds by default.
+    """
+    def __init__(self, control, rate=ACQUIRE_RATE, size=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.control = control
+        self.rate = rate
+        self.period = 1 / rate
+        if size is None:
+            size = int(BUFFER_TIME * rate)
+        self.size = size
+        self._times = np.zeros(size)
+        self._data = np.zeros((size, control.channel_num))
+        self._setpoints = np.zeros((size, control.channel_num))
+        self.regulator = None  # flowRegulate.Regulator whose targets are recorded as setpoints
+        self._count = 0
+        self._missed = 0
+        self._errors = 0
+        self._last_error = None
+        self._stop = threading.Event()
+
+    def __repr__(self):
+        return repr(['Pressure acquisition', self.rate])
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    @property
+    def count(self):
+        """Returns the number of samples acquired.
+        """
+        return self._count
+
+    @property
+    def missed(self):
+        """Returns the number of sweeps skipped because they were more than a period late.
+        """
+        return self._missed
+
+    @property
+    def errors(self):
+        """Returns the number of sweeps that failed with an exception.
+        """
+        return self._errors
+
+    @property
+    def last_error(self):
+        """Returns the exception of the last failed sweep, None if none failed.
+        """
+        return self._last_error
+
+    @property
+    def channel_num(self):
+        return self._data.shape[1]
+
+    def latest(self):
+        """Returns the time and pressures (mbar) of the newest sample, None before the first.
+        """
+        count = self._count
+        if count == 0:
+            return None
+        idx = (count - 1) % self.size
+        return self._times[idx], self._data[idx].copy()
+
+    def read(self, cursor):
+        """Returns the samples acquired since a cursor.
+
+        Parameters
+        ----------
+        cursor : int
+            Sample count of the previous read, 0 for all samples.
+
+        Returns
+        -------
+        cursor : int
+            Cursor for the next read.
+
+        times : numpy.ndarray
+            hware.clock() times of the samples.
+
+        pressures : numpy.ndarray
+            Pressures in mbar, samples x channels.
+
+        setpoints : numpy.ndarray
+            Requested pressures in mbar at the time of each sample, samples x channels.
+
+        lost : int
+            Samples since the cursor that were overwritten before reading.
+        """
+        count = self._count
+        start = max(cursor, count - self.size)
+        idx = np.arange(start, count) % self.size
+        times, pressures, setpoints = self._times[idx], self._data[idx], self._setpoints[idx]
+        # Drop samples that the acquisition thread overwrote, or is overwriting, while copying
+        valid = max(start, self._count - self.size + 1)
+        drop = valid - start
+        return count, times[drop:], pressures[drop:], setpoints[drop:], valid - cursor
+
+    def reader(self, rate=None, average=True):
+        return Reader(self, rate, average)
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        hware.timing_thread(True)
+        try:
+            tick = 0
+            time_start = hware.clock()
+            while not self._stop.is_set():
+                deadline = time_start + tick * self.period
+                hware.sleep_until(deadline)
+                tick += 1
+                if hware.clock() - deadline > self.period:
+                    self._missed += 1
+                    continue
+                try:
+                    time_stamp, pressures, timers = self.control.read_sweep()
+                except Exception as e:
+                    # Keep sampling, a frozen stream would stall every consumer unnoticed
+                    self._errors += 1
+                    self._last_error = e
+                    warnings.warn('Pressure sweep failed: %s' % e)
+                    continue
+                idx = self._count % self.size
+                self._data[idx] = pressures
+                # The regulator sends its PID commands as setpoints, record what was requested
+                regulator = self.regulator
+                self._setpoints[idx] = self.control.setpoints if regulator is None else regulator.targets
+                self._times[idx] = time_stamp
+                self._count += 1
+        finally:
+            hware.timing_thread(False)
+
+class Reader(object):
+    """Acquisition consumer with its own cursor, decimation and averaging.
+
+    Parameters
+    ----------
+    acquisition : Acquisition
+        Running acquisition.
+
+    rate : float, optional
+        Samples per second delivered by read(); None delivers every sample.
+
+    average : bool
+        Average each block of decimated samples, otherwise take the last
+        sample of each block.
+    """
+    def __init__(self, acquisition, rate=None, average=True):
+        self.acquisition = acquisition
+        if rate is None or rate >= acquisition.rate:
+            self.decimate = 1
+        else:
+            self.decimate = int(round(acquisition.rate / rate))
+        self.average = average
+        self.cursor = acquisition.count
+        self.lost = 0
+
+    def read(self):
+        """Returns the times and pressures (mbar) of the new complete blocks of samples.
+
+        Samples of an incomplete block are kept for the next read.
+        """
+        cursor, times, pressures, setpoints, lost = self.acquisition.read(self.cursor)
+        self.lost += lost
+        blocks = len(times) // self.decimate
+        used = blocks * self.decimate
+        self.cursor = cursor - (len(times) - used)
+        times, pressures = times[:used], pressures[:used]
+        if self.decimate == 1:
+            return times, pressures
+        times = times[self.decimate-1::self.decimate]
+        if self.average:
+            pressures = pressures.reshape(blocks, self.decimate, pressures.shape[1]).mean(axis=1)
+        else:
+            pressures = pressures[self.decimate-1::self.decimate]
+        return times, pressures
+
+    def samples(self):
+        """Returns the times, pressures and setpoints (mbar) of all samples since the last read.
+        """
+        cursor, times, pressures, setpoints, lost = self.acquisition.read(self.cursor)
+        self.lost += lost
+        self.cursor = cursor
+        return times, pressures, setpoints
+
+    def mean(self):
+        """Returns the mean pressures (mbar) of all samples since the last read, None if there are none.
+        """
+        times, pressures, setpoints = self.samples()
+        if not len(times):
+            return None
+        return pressures.mean(axis=0)
@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20160308
-# version update    : 20161024
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : As module
 # notes             : Do not quick fix functions for specific needs, keep them general!
@@ -35,6 +35,8 @@ import config
 # [SETTINGS]
 P_READ_TIME = 0.3  # Refresh time in seconds for pressure read
 RING_BUFFER_SIZE = 3  # Moving average
+SMOOTHING = 'mean'  # Pressure display smoothing: 'mean', 'ema' or 'median'
+SETPOINT_RATE = 10  # Maximum setpoint writes per second and channel from the GUI
 FRACTION_WIDTH = {'mba':0, 'kpa':1, 'psi':2}
 INTEGER_WIDTH = {'mba':4, 'kpa':3, 'psi':2}
 UNITS = ['mBa', 'kPa', 'PSI']
@@ -43,12 +45,17 @@ UNITS_LOW = ['mba', 'kpa', 'psi']
 class MainWindow(wx.Frame):
     """This is the main window for the Flow Module of the Microfluidic Control program.
     """
-    def __init__(self, parent=None, config_handler=None, control=None):
+    def __init__(self, parent=None, config_handler=None, control=None, acquisition=None, regulator=None):
         super(MainWindow, self).__init__(parent)
         self.SetTitle('Microfluidic Control - Flow Module')
         # Parameters
         self.config = config_handler
         self.control = control
+        self.acquisition = acquisition
+        self.regulator = regulator
+        # Pressures are set through the regulator if there is one, coalesced
+        self.setter = SetpointCoalescer(control if regulator is None else regulator)
+        self.setter.start()
         self.current_chip = self.config.chip.name
 
         # Window Size/Postion Handler
@@ -87,7 +94,7 @@ class MainWindow(wx.Frame):
         self.Bind(wx.EVT_SIZING, self.update)
         self.Bind(wx.EVT_CLOSE, self.close)
 
-        self.p_read = PressureRead(self, self.control)
+        self.p_read = PressureRead(self, self.control, self.acquisition)
 
     def __del__(self):
         self.Close()
@@ -103,38 +110,21 @@ class MainWindow(wx.Frame):
             self.current_chip = self.config.chip.name
             self.init()
             self.Layout()
-            self.p_read = PressureRead(self, self.control)
+            self.p_read = PressureRead(self, self.control, self.acquisition)
         self.Show(True)
 
     def update(self, event):
         self.window_position.update()
 
     def unit_change(self, event):
-        unit = event.GetSelection()
-        self.control.unit = str(UNITS[unit])
-        print(self.control.unit)
-
-        for channel_num in xrange(1, self.control.channel_num+1):
-            slider = "pSldr%s" % channel_num
-            nctrl = "pCtrl%s" % channel_num
-            slider_id = self.p_control.FindWindowByName(slider)    
-            nctrl_id = self.p_control.FindWindowByName(nctrl)
-            if unit == 0:
-                nctrl_id.SetIntegerWidth(INTEGER_WIDTH[self.control.unit])
-                nctrl_id.SetFractionWidth(FRACTION_WIDTH['mba'])
-                print(self.control.limit)
-                nctrl_id.SetMax(self.control.limit)
-            if unit == 1:
-                nctrl_id.SetIntegerWidth(INTEGER_WIDTH[self.control.unit])
-                nctrl_id.SetFractionWidth(FRACTION_WIDTH['kpa'])
-                print(self.control.limit)
-                nctrl_id.SetMax(self.control.limit)
-            if unit == 2:
-                nctrl_id.SetIntegerWidth(INTEGER_WIDTH[self.control.unit])
-                nctrl_id.SetFractionWidth(FRACTION_WIDTH['psi'])
-                print(self.control.limit)
-                nctrl_id.SetMax(self.control.limit)
-            nctrl_id.SetValue(0)
+        """Show the setpoints in the new unit; only the display changes, nothing is sent to the hardware.
+        """
+        self.control.unit = UNITS_LOW[event.GetSelection()]
+        if self.regulator is None:
+            setpoints = self.control.convert(self.control.setpoints)
+        else:
+            setpoints = self.control.convert(self.regulator.targets)
+        self.p_control.show_unit(setpoints)
 
 class ChannelSliders(wx.Panel):
     def __init__(self, parent=None, config=None, control=None):
@@ -146,6 +136,8 @@ class ChannelSliders(wx.Panel):
 
         pSizer = wx.BoxSizer( wx.HORIZONTAL )
         numFont = wx.Font(9, wx.DEFAULT, wx.NORMAL, wx.NORMAL)
+        self.nctrls = []
+        self._showing = False  # Set while setpoints are shown, their text events are not set again
         for channel_no in xrange(1, self.control.channel_num+1):
             slideSizer = wx.BoxSizer( wx.VERTICAL )
             name_n = "nTxt%s" % channel_no
@@ -171,6 +163,7 @@ class ChannelSliders(wx.Panel):
                                    fractionWidth = FRACTION_WIDTH[self.control.unit], groupDigits = False, autoSize = False, style = wx.TR_SINGLE|wx.CENTER, size = (50,-1))
             pressure_set.Bind( wx.EVT_TEXT, self.set_pressure )
             pressure_set.SetFont( numFont )
+            self.nctrls.append(pressure_set)
             slideSizer.Add( pressure_set, 0, wx.ALIGN_CENTER_HORIZONTAL|wx.EXPAND, 5 )
             pressure_zero = wx.Button( self, wx.ID_ANY, label = u"Zero", name = name_z, size = ( 52,25 ) )
             pressure_zero.Bind(wx.EVT_BUTTON, self.set_zero)
@@ -191,11 +184,27 @@ class ChannelSliders(wx.Panel):
     def set_all_zero(self, event):
         [self.set_control(event, value=0, channel=ch) for ch in xrange(1, self.control.channel_num+1)]
 
+    def show_unit(self, setpoints):
+        """Show setpoints, one per channel in the current unit, without setting them.
+        """
+        unit = self.control.unit
+        self._showing = True
+        try:
+            for nctrl, setpoint in zip(self.nctrls, setpoints):
+                nctrl.SetIntegerWidth(INTEGER_WIDTH[unit])
+                nctrl.SetFractionWidth(FRACTION_WIDTH[unit])
+                nctrl.SetMax(self.control.limit)
+                nctrl.SetValue(round(setpoint, FRACTION_WIDTH[unit]))
+        finally:
+            self._showing = False
+
     def set_pressure(self, event):
+        if self._showing:
+            return
         o = event.GetEventObject()
         channel_num = filter( str.isdigit, str(o.GetName()) )
         self.set_control(event)
-        self.control.set_pressure(o.GetValue(), channel_num)
+        self.parent.setter.set_pressure(o.GetValue(), channel_num, self.control.unit)
         print("Set pressure %s to %4.1f" % (channel_num, o.GetValue()) )
 
     def set_control(self, event, value=0, channel=None):
@@ -209,7 +218,7 @@ class ChannelSliders(wx.Panel):
         slider_id = self.Parent.FindWindowByName(slider)
         nctrl_id = self.Parent.FindWindowByName(nctrl)
         if "Sldr" in o.GetName():
-            value_conv = self.control._unit_conv(o.GetValue())
+            value_conv = float(self.control.convert(o.GetValue()))
             nctrl_id.SetValue(value_conv)
         elif "Ctrl" in o.GetName():
             value_conv = o.GetValue()/self.control.factor
@@ -219,25 +228,170 @@ class ChannelSliders(wx.Panel):
             slider_id.SetValue(value)
         
 
-class RingBuffer:
-    def __init__(self, size, value):
-        self.data = [value for i in xrange(size)]
+class SetpointCoalescer(threading.Thread):
+    """Setpoint writer that coalesces GUI pressure changes.
+
+    Keeps only the latest pending pressure per channel and writes them at
+    most SETPOINT_RATE times per second, so typing and slider drags do not
+    flood the controller. Zero pressures are written immediately. Pending
+    pressures keep the unit they were entered in.
+
+    Parameters
+    ----------
+    setter : mfcs-ezWrapper.Load, flowRegulate.Regulator
+        Target with set_pressure().
+
+    rate : float
+        Maximum writes per second.
+    """
+    def __init__(self, setter, rate=SETPOINT_RATE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.setter = setter
+        self.period = 1 / rate
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()  # Keeps a zero from being overtaken by a flush in progress
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    @property
+    def pending(self):
+        return dict(self._pending)
+
+    @property
+    def unit(self):
+        """Returns the current unit of the flow control behind the setter.
+        """
+        return getattr(self.setter, 'control', self.setter).unit
+
+    def set_pressure(self, pressure=0, channel=None, unit=None):
+        """Queue a pressure like Load.set_pressure; channel None sets all channels.
+
+        Unit None is the current unit, resolved now and not when the pressure is written.
+        """
+        if unit is None:
+            unit = self.unit
+        with self._lock:
+            if channel is None:
+                # A pressure for all channels replaces the pending single channel pressures
+                self._pending.clear()
+            if pressure != 0:
+                self._pending[channel] = (pressure, unit)
+                self._wake.set()
+                return
+            self._pending.pop(channel, None)
+            all_pending = None in self._pending
+        with self._write_lock:
+            if all_pending:
+                # Write the pending pressure for all channels first, so the zero is not overwritten
+                self.flush()
+            self.setter.set_pressure(0, channel, unit)
+
+    def flush(self):
+        """Write all pending pressures now.
+        """
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            # All channels first, so later single channel values win
+            if None in pending:
+                pressure, unit = pending.pop(None)
+                self.setter.set_pressure(pressure, None, unit)
+            for channel, (pressure, unit) in pending.items():
+                self.setter.set_pressure(pressure, channel, unit)
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            self.flush()
+            self._stop.wait(self.period)
+        self.flush()
+
+class RingBuffer(object):
+    """Preallocated ring buffer of samples x channels with smoothing.
+
+    The running sum is updated on every append and recomputed once per
+    pass over the buffer to drop rounding errors, so the mean costs no
+    more than the exponential moving average.
+
+    Parameters
+    ----------
+    size : int
+        Number of samples.
+
+    value : list
+        Initial value of every sample, one per channel.
+
+    mode : str
+        Smoothing: 'mean' of the buffer, 'ema' exponential moving average,
+        or 'median' of the buffer.
+
+    alpha : float, optional
+        EMA weight of a new sample, 2 / (size + 1) by default.
+    """
+    def __init__(self, size, value, mode=SMOOTHING, alpha=None):
+        if mode not in ('mean', 'ema', 'median'):
+            raise ValueError("Smoothing modes: 'mean', 'ema' and 'median'. %s" % mode)
+        value = np.asarray(value, dtype=float)
+        self.data = np.tile(value, (size, 1))
+        self.mode = mode
+        if alpha is None:
+            alpha = 2 / (size + 1)
+        self.alpha = alpha
+        self._idx = 0
+        self._sum = self.data.sum(axis=0)
+        self._ema = value.copy()
 
     def append(self, x):
-        self.data.pop(0)
-        self.data.append(x)
+        x = np.asarray(x, dtype=float)
+        self._sum += x - self.data[self._idx]
+        self.data[self._idx] = x
+        self._idx = (self._idx + 1) % len(self.data)
+        if self._idx == 0:
+            self._sum = self.data.sum(axis=0)
+        self._ema += self.alpha * (x - self._ema)
+
+    @property
+    def mean(self):
+        return self._sum / len(self.data)
+
+    @property
+    def ema(self):
+        return self._ema
+
+    @property
+    def median(self):
+        return np.median(self.data, axis=0)
 
     @property
     def get(self):
-        return np.mean(self.data, axis=0).tolist()
+        return getattr(self, self.mode).tolist()
 
 class PressureRead(threading.Thread):
     """Pressure read thread.
+
+    Displays the mean of the acquired samples since the previous refresh,
+    or reads the pressures itself if there is no acquisition running.
     """
-    def __init__(self, parent, control):
+    def __init__(self, parent, control, acquisition=None):
         threading.Thread.__init__(self)
         self.parent = parent
         self.control = control
+        self.reader = None
+        if acquisition is not None:
+            self.reader = acquisition.reader(1 / P_READ_TIME)
         self.buffer = RingBuffer(RING_BUFFER_SIZE, [0]*self.control.channel_num)
         self._stop = threading.Event()
         self.daemon = True
@@ -261,10 +415,15 @@ class PressureRead(threading.Thread):
         """
         while self.halt is False:
             time.sleep(P_READ_TIME)
-            p_chan = self.control.read_pressure()
-            p_chan = np.array(p_chan).clip(min=0).tolist()
-            self.buffer.append(p_chan)
-            for idx, p in enumerate(self.buffer.get):
+            # The buffer holds mbar, so a unit change does not mix units in its window
+            if self.reader is None:
+                p_chan = self.control.read_pressure(unit='mba')
+            else:
+                p_chan = self.reader.mean()
+                if p_chan is None:
+                    continue
+            self.buffer.append(np.clip(p_chan, 0, None))
+            for idx, p in enumerate(self.control.convert(self.buffer.get)):
                 label = "%3.1f %s" % (p, self.control.unit)
                 i_gui = "pTxt%s" % str(idx+1)
                 try: 
@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20160308
-# version update    : 20161021
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : As module
 # notes             : Do not quick fix functions for specific needs, keep them general!
@@ -27,6 +27,9 @@ import wx
 # Project
 import config
 import flowGui
+import flowAcquire
+import flowRegulate
+import flowRecord
 
 class Control(object):
     """"""
@@ -36,12 +39,39 @@ class Control(object):
 
         var = self.config.hware['flowing']['hardware']
         self.flow_module = importlib.import_module("flow."+var+"Wrapper")
-        self.control = self.flow_module.Load(self.config.hware['flowing']['config'])
+        flowing = self.config.hware['flowing']
+        self.control = self.flow_module.Load(flowing['config'], library=flowing.get('library'), sim=flowing.get('sim'))
         self.control.connect()
         if self.control.status is not None:
-            self.gui = flowGui.MainWindow(self.parent, self.config, self.control)
+            rate = self.config.hware['flowing'].get('rate', flowAcquire.ACQUIRE_RATE)
+            self.acquisition = flowAcquire.Acquisition(self.control, rate)
+            self.acquisition.start()
+            self.recorder = None
+            if flowing.get('record') is not None:
+                self.recorder = flowRecord.Recorder(self.acquisition, flowing['record'])
+                self.recorder.start()
+            self.regulator = None
+            if 'regulate' in self.config.hware['flowing']:
+                self.regulator = flowRegulate.Regulator(self.control, self.acquisition, **self.config.hware['flowing']['regulate'])
+                self.regulator.enable()
+                self.acquisition.regulator = self.regulator
+                self.regulator.start()
+            self.gui = flowGui.MainWindow(self.parent, self.config, self.control, self.acquisition, self.regulator)
 
     def __repr__(self):
         return repr([self.control])
 
+    def close(self):
+        """Stop regulation and write the recording before the acquisition and hardware stop.
+        """
+        if getattr(self, 'regulator', None) is not None:
+            self.regulator.stop()
+            self.regulator.join()
+        if getattr(self, 'recorder', None) is not None:
+            self.recorder.stop()
+        if getattr(self, 'acquisition', None) is not None:
+            self.acquisition.stop()
+            self.acquisition.join()
+        self.control.close()
+
 
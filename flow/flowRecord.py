@@ -0,0 +1,258 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : flowRecord.py
+# description       : Microfluidic Control - Flow module - Pressure recorder
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module, enable with "record" in `flowing` of hwareConfig.json
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+"""
+A recording is a folder with compressed NPZ chunks and an index:
+
+    pressures_20261018_120000/
+        index.json          origin, channels and per chunk: file, first and last time, samples
+        chunk_000000.npz    'time' (clock seconds), 'pressure' and 'setpoint' (mbar, samples x channels)
+        ...
+
+Chunks hold a fixed number of samples, so memory is bounded whatever the
+run length, and a time range only loads the chunks that overlap it.
+"""
+
+# [Modules]
+# General Python
+import os
+import sys
+import time
+import json
+import warnings
+import threading
+# Data
+import numpy as np
+# Project
+import hware
+import flowUnits
+
+# [SETTINGS]
+CHUNK_SIZE = 30000  # Samples per chunk file, 10 minutes at 50 Hz
+POLL_TIME = 0.5  # Seconds between reads of the acquisition
+INDEX_FILE = 'index.json'
+
+class Recorder(threading.Thread):
+    """Pressure recording thread.
+
+    Reads every sample of a running acquisition and writes the measured
+    pressures and setpoints in chunks. Compression runs on this thread,
+    never on the acquisition thread.
+
+    Parameters
+    ----------
+    acquisition : flowAcquire.Acquisition
+        Running acquisition.
+
+    folder : str
+        Folder for recordings; every recording gets its own subfolder.
+
+    chunk_size : int
+        Samples per chunk file.
+    """
+    def __init__(self, acquisition, folder, chunk_size=CHUNK_SIZE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.reader = acquisition.reader()
+        self.chunk_size = chunk_size
+        self.path = os.path.join(folder, time.strftime('pressures_%Y%m%d_%H%M%S'))
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        channel_num = acquisition.channel_num
+        self._times = np.zeros(chunk_size)
+        self._pressures = np.zeros((chunk_size, channel_num), dtype=np.float32)
+        self._setpoints = np.zeros((chunk_size, channel_num), dtype=np.float32)
+        self._fill = 0
+        self._index = {'origin': [hware.clock(), time.time()],
+                       'channels': channel_num,
+                       'unit': 'mba',
+                       'chunks': []}
+        self._stop = threading.Event()
+        self._write_index()
+
+    def __repr__(self):
+        return repr(['Pressure recorder', self.path])
+
+    def stop(self, timeout=None):
+        """Stop and write the samples recorded so far, including the partial chunk.
+
+        Returns when they are written, or after timeout seconds.
+        """
+        self._stop.set()
+        if self.is_alive():
+            if threading.current_thread() is not self:
+                self.join(timeout)
+        else:
+            self._append()
+            self._flush()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    @property
+    def lost(self):
+        """Returns the number of samples overwritten in the acquisition before they were recorded.
+        """
+        return self.reader.lost
+
+    def _write_index(self):
+        """Replace the index so that a complete index exists at any time.
+
+        POSIX rename replaces atomically; on Windows the old index is kept
+        as backup until the new one is in place.
+        """
+        index_path = os.path.join(self.path, INDEX_FILE)
+        temp_path = index_path + '.tmp'
+        backup_path = index_path + '.bak'
+        with open(temp_path, 'w') as index_file:
+            json.dump(self._index, index_file, indent=2)
+        if sys.platform != 'win32' or not os.path.exists(index_path):
+            os.rename(temp_path, index_path)
+            return
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        os.rename(index_path, backup_path)
+        os.rename(temp_path, index_path)
+        os.remove(backup_path)
+
+    def _flush(self):
+        if self._fill == 0:
+            return
+        file_name = 'chunk_%06d.npz' % len(self._index['chunks'])
+        np.savez_compressed(os.path.join(self.path, file_name),
+                            time=self._times[:self._fill],
+                            pressure=self._pressures[:self._fill],
+                            setpoint=self._setpoints[:self._fill])
+        self._index['chunks'].append({'file': file_name,
+                                      'start': float(self._times[0]),
+                                      'end': float(self._times[self._fill-1]),
+                                      'samples': self._fill})
+        self._write_index()
+        self._fill = 0
+
+    def _append(self):
+        times, pressures, setpoints = self.reader.samples()
+        done = 0
+        while done < len(times):
+            count = min(len(times) - done, self.chunk_size - self._fill)
+            self._times[self._fill:self._fill+count] = times[done:done+count]
+            self._pressures[self._fill:self._fill+count] = pressures[done:done+count]
+            self._setpoints[self._fill:self._fill+count] = setpoints[done:done+count]
+            self._fill += count
+            done += count
+            if self._fill == self.chunk_size:
+                self._flush()
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        while not self._stop.wait(POLL_TIME):
+            self._append()
+        self._append()
+        self._flush()
+
+class RecordReader(object):
+    """Time range reader of a pressure recording.
+
+    Parameters
+    ----------
+    path : str
+        Recording folder.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.refresh()
+
+    def __len__(self):
+        return int(sum(chunk['samples'] for chunk in self._index['chunks']))
+
+    def refresh(self):
+        """Reload the index for chunks written since opening.
+        """
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_path) and os.path.exists(index_path + '.bak'):
+            # Interrupted index replace, see Recorder._write_index
+            index_path += '.bak'
+        with open(index_path) as index_file:
+            self._index = json.load(index_file)
+        chunks = self._index['chunks']
+        self._starts = np.array([chunk['start'] for chunk in chunks])
+        self._ends = np.array([chunk['end'] for chunk in chunks])
+
+    @property
+    def origin(self):
+        """Returns the clock time and wall time (seconds since epoch) of the recording start.
+        """
+        return tuple(self._index['origin'])
+
+    @property
+    def span(self):
+        """Returns the clock times of the first and last recorded samples, None if empty.
+        """
+        if not len(self._starts):
+            return None
+        return self._starts[0], self._ends[-1]
+
+    def read(self, start=None, end=None, channels=None, unit='mba'):
+        """Returns the samples between two clock times (inclusive).
+
+        Parameters
+        ----------
+        start, end : float, optional
+            Clock times, the whole recording by default.
+
+        channels : list, optional
+            Channel numbers (1-based), all channels by default.
+
+        unit : str
+            Unit of the returned pressures.
+
+        Returns
+        -------
+        times : numpy.ndarray
+            Clock times of the samples.
+
+        pressures, setpoints : numpy.ndarray
+            Measured pressures and setpoints, samples x channels.
+        """
+        if start is None:
+            start = -np.inf
+        if end is None:
+            end = np.inf
+        first = np.searchsorted(self._ends, start, side='left')
+        last = np.searchsorted(self._starts, end, side='right')
+        columns = slice(None) if channels is None else np.asarray(channels, dtype=int) - 1
+        times, pressures, setpoints = [], [], []
+        for chunk in self._index['chunks'][first:last]:
+            with np.load(os.path.join(self.path, chunk['file'])) as data:
+                chunk_times = data['time']
+                low = np.searchsorted(chunk_times, start, side='left')
+                high = np.searchsorted(chunk_times, end, side='right')
+                times.append(chunk_times[low:high])
+                pressures.append(data['pressure'][low:high][:, columns])
+                setpoints.append(data['setpoint'][low:high][:, columns])
+        if not times:
+            channel_num = self._index['channels'] if channels is None else len(channels)
+            empty = np.zeros((0, channel_num), dtype=np.float32)
+            return np.zeros(0), empty, empty.copy()
+        return (np.concatenate(times),
+                flowUnits.from_mbar(np.concatenate(pressures), unit),
+                flowUnits.from_mbar(np.concatenate(setpoints), unit))
@@ -0,0 +1,263 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : flowRegulate.py
+# description       : Microfluidic Control - Flow module - Closed-loop pressure regulation
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module, configure with "regulate" in `flowing` of hwareConfig.json
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import warnings
+import threading
+# Data
+import numpy as np
+# Project
+import hware
+
+# [SETTINGS]
+CONTROL_RATE = 20  # Control steps per second
+KP = 0.5  # Proportional gain
+KI = 2.0  # Integral gain, per second
+KD = 0.0  # Derivative gain on the measurement, seconds
+FF = 1.0  # Feed-forward gain of the setpoint
+SLEW = 500  # Maximum command change in mbar per second
+SETTLE_BAND = 0.02  # Settled within this fraction of the step...
+SETTLE_MIN = 2.0  # ...or within this many mbar, whichever is larger
+SETTLE_HOLD = 0.5  # Seconds within the band before a step counts as settled
+MIN_CHANGE = 0.1  # Commands closer than this in mbar to the last command are not sent
+
+class Regulator(threading.Thread):
+    """Per-channel pressure regulation thread.
+
+    Runs a PID loop with setpoint feed-forward on every enabled channel at
+    a fixed rate against the measured pressure and sends the result as the
+    controller setpoint. All channels are computed in one vector step. The
+    command change is limited to `slew` mbar per second and clamped to the
+    pressure limit; the integral stops where the sent command falls short
+    of the computed one and the error would drive it further (anti-windup).
+
+    Every setpoint change is followed until settled; `metrics` holds per
+    channel the settle time and overshoot of each step.
+
+    Parameters
+    ----------
+    control : mfcs-ezWrapper.Load
+        Connected flow control.
+
+    acquisition : flowAcquire.Acquisition, optional
+        Running acquisition for the measurements, otherwise every step
+        reads the pressures itself.
+
+    rate : float
+        Control steps per second.
+
+    kp, ki, kd, ff : float or list
+        Gains, one for all channels or one per channel.
+
+    slew : float
+        Maximum command change in mbar per second.
+    """
+    def __init__(self, control, acquisition=None, rate=CONTROL_RATE, kp=KP, ki=KI, kd=KD, ff=FF, slew=SLEW):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.control = control
+        self.acquisition = acquisition
+        self.period = 1 / rate
+        channel_num = control.channel_num
+        self.kp = np.resize(np.asarray(kp, dtype=float), channel_num)
+        self.ki = np.resize(np.asarray(ki, dtype=float), channel_num)
+        self.kd = np.resize(np.asarray(kd, dtype=float), channel_num)
+        self.ff = np.resize(np.asarray(ff, dtype=float), channel_num)
+        self.slew = slew
+        self.limit = control._unit_conv(control.limit, set=True)
+        self.metrics = [[] for idx in xrange(channel_num)]
+        self._lock = threading.Lock()
+        self._enabled = np.zeros(channel_num, dtype=bool)
+        self._targets = np.array(control.setpoints, dtype=float)
+        self._commands = self._targets.copy()
+        self._integral = np.zeros(channel_num)
+        self._last_measured = None
+        self._last_time = None
+        # Step response tracking
+        self._step_start = np.zeros(channel_num)
+        self._step_from = np.zeros(channel_num)
+        self._peak = np.zeros(channel_num)
+        self._in_band = np.full(channel_num, np.nan)
+        self._tracking = np.zeros(channel_num, dtype=bool)
+        self._stop = threading.Event()
+
+    def __repr__(self):
+        return repr(['Pressure regulator', self._targets.tolist()])
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    @property
+    def targets(self):
+        return self._targets.copy()
+
+    @property
+    def enabled(self):
+        return self._enabled.copy()
+
+    def enable(self, channel=None, enabled=True):
+        """Regulate channels (1-based), all by default; disabled channels keep their last setpoint.
+        """
+        idx = slice(None) if channel is None else int(channel) - 1
+        with self._lock:
+            if enabled:
+                self._commands[idx] = self.control.setpoints[idx]
+                self._integral[idx] = 0
+            self._enabled[idx] = enabled
+
+    def set_pressure(self, pressure=0, channel=None, unit=None):
+        """Set the target pressure of channels (1-based), all by default, like Load.set_pressure.
+
+        Channels that are not regulated are set directly.
+        """
+        pressure = self.control._unit_conv(pressure, set=True, unit=unit)
+        if channel is None:
+            idx = np.arange(len(self._targets))
+        else:
+            idx = np.array([int(channel) - 1])
+        measured = self._last_measured
+        if measured is None:
+            measured = self._measured()
+        with self._lock:
+            for unsettled in idx[self._tracking[idx]]:
+                self._record(unsettled, None)
+            self._targets[idx] = pressure
+            self._step_from[idx] = measured[idx]
+            self._peak[idx] = measured[idx]
+            self._step_start[idx] = hware.clock()
+            self._in_band[idx] = np.nan
+            self._tracking[idx] = True
+            direct = idx[~self._enabled[idx]]
+        for num in direct:
+            self.control._pressure_func(num + 1, pressure)
+
+    def set_pressures(self, pressures, channels=None, unit=None):
+        """Set the targets of several channels (1-based) in one pass, like Load.set_pressures.
+
+        Meant for streamed setpoints: the changes are not tracked as steps.
+        """
+        pressures = self.control._unit_conv(np.asarray(pressures, dtype=float), set=True, unit=unit)
+        if channels is None:
+            idx = np.arange(len(self._targets))
+        else:
+            idx = np.asarray(channels, dtype=int) - 1
+        # One pressure for all channels
+        pressures = np.broadcast_to(pressures, idx.shape)
+        with self._lock:
+            self._targets[idx] = pressures
+            self._tracking[idx] = False
+            direct = ~self._enabled[idx]
+        if direct.any():
+            self.control.set_pressures(pressures[direct], idx[direct] + 1, unit='mba')
+
+    # Base functions
+    def _measured(self):
+        if self.acquisition is None:
+            return self.control.read_sweep()[1].copy()
+        sample = self.acquisition.latest()
+        if sample is None:
+            return self.control.read_sweep()[1].copy()
+        return sample[1]
+
+    def _command(self, measured, dt):
+        """Returns the commands of one PID step and updates the integral.
+        """
+        error = self._targets - measured
+        derivative = 0
+        if self._last_measured is not None and dt > 0:
+            derivative = -self.kd * (measured - self._last_measured) / dt
+        integral = self._integral + self.ki * error * dt
+        command = self.ff * self._targets + self.kp * error + integral + derivative
+        max_change = self.slew * dt
+        sent = np.clip(command, self._commands - max_change, self._commands + max_change)
+        sent = np.clip(sent, 0, self.limit)
+        # Hold the integral while the sent command is slew limited or clamped in the error direction
+        windup = (command != sent) & (np.sign(error) == np.sign(command - sent))
+        self._integral = np.where(windup, self._integral, integral)
+        return sent
+
+    def _record(self, idx, settle_time):
+        step = self._targets[idx] - self._step_from[idx]
+        overshoot = 0.0
+        if step != 0:
+            overshoot = max(0.0, (self._peak[idx] - self._targets[idx]) / step * 100)
+        self.metrics[idx].append({'setpoint': float(self._targets[idx]),
+                                  'step': float(step),
+                                  'settle_time': settle_time,
+                                  'overshoot': overshoot})
+
+    def _track(self, measured, time_now):
+        """Follow the step responses and record settle time and overshoot of settled steps.
+
+        Steps replaced by a new setpoint before settling are recorded with
+        settle_time None.
+        """
+        step = self._targets - self._step_from
+        rising = step >= 0
+        self._peak = np.where(rising, np.maximum(self._peak, measured), np.minimum(self._peak, measured))
+        band = np.maximum(np.abs(step) * SETTLE_BAND, SETTLE_MIN)
+        inside = np.abs(self._targets - measured) <= band
+        self._in_band = np.where(inside, np.where(np.isnan(self._in_band), time_now, self._in_band), np.nan)
+        # In band channels only, outside the band _in_band is NaN
+        held = np.zeros(len(inside), dtype=bool)
+        held[inside] = time_now - self._in_band[inside] >= SETTLE_HOLD
+        settled = self._tracking & held
+        for idx in np.flatnonzero(settled):
+            self._record(idx, float(self._in_band[idx] - self._step_start[idx]))
+        self._tracking &= ~settled
+
+    def step(self):
+        """Run one control step.
+        """
+        measured = self._measured()
+        time_now = hware.clock()
+        dt = self.period if self._last_time is None else time_now - self._last_time
+        with self._lock:
+            commands = self._command(measured, dt)
+            self._track(measured, time_now)
+            send = self._enabled & (np.abs(commands - self.control.setpoints) >= MIN_CHANGE)
+            self._commands = np.where(self._enabled, commands, self._commands)
+        for idx in np.flatnonzero(send):
+            self.control._pressure_func(idx + 1, float(commands[idx]))
+        self._last_measured = measured
+        self._last_time = time_now
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        hware.timing_thread(True)
+        try:
+            tick = 0
+            time_start = hware.clock()
+            while not self._stop.is_set():
+                deadline = time_start + tick * self.period
+                hware.sleep_until(deadline)
+                tick += 1
+                if hware.clock() - deadline > self.period:
+                    # Resume the schedule instead of catching up with a burst of steps
+                    tick = int((hware.clock() - time_start) / self.period) + 1
+                self.step()
+        finally:
+            hware.timing_thread(False)
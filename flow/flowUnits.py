@@ -0,0 +1,64 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : flowUnits.py
+# description       : Microfluidic Control - Flow module - Pressure units
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module
+# notes             : Pressures are kept in mbar everywhere; units only apply for display and input.
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import warnings
+# Data
+import numpy as np
+
+# [CONSTANTS]
+MBA2PSI = 0.0145037738007
+MBA2KPA = 0.1
+FACTORS = {'mba':1, 'psi':MBA2PSI, 'kpa':MBA2KPA}  # Multiply mbar by the factor for the unit
+
+_vectors = {}
+
+def factor(unit):
+    try:
+        return FACTORS[unit]
+    except KeyError:
+        raise AttributeError("Available units: millibar: 'mba'; kilopascal: 'kpa'; and pounds-per-sqaure-inch: 'psi'. %s" % unit)
+
+def factors(unit, size):
+    """Returns the cached read-only factor vector of a unit for size channels.
+    """
+    key = (unit, size)
+    if key not in _vectors:
+        vector = np.full(size, factor(unit))
+        vector.flags.writeable = False
+        _vectors[key] = vector
+    return _vectors[key]
+
+def from_mbar(pressures, unit):
+    """Convert mbar to a unit; the last axis of arrays is the channels.
+    """
+    pressures = np.asarray(pressures, dtype=float)
+    if pressures.ndim == 0:
+        return pressures * factor(unit)
+    return pressures * factors(unit, pressures.shape[-1])
+
+def to_mbar(pressures, unit):
+    """Convert a unit to mbar; the last axis of arrays is the channels.
+    """
+    pressures = np.asarray(pressures, dtype=float)
+    if pressures.ndim == 0:
+        return pressures / factor(unit)
+    return pressures / factors(unit, pressures.shape[-1])
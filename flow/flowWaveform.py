@@ -0,0 +1,272 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : flowWaveform.py
+# description       : Microfluidic Control - Flow module - Pressure waveforms
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+"""
+Waveforms are functions of the time in seconds since the start of
+playback that return pressures, in the unit of the Player:
+
+    player = Player(control, {1: Ramp(0, 8, 30), 2: Sine(6, 1, 2.5)}, unit='psi')
+    player.start()
+
+Every waveform takes scalars or numpy arrays of times. After its duration
+a waveform holds its last value.
+"""
+
+# [Modules]
+# General Python
+import warnings
+import threading
+# Data
+import numpy as np
+# Project
+import hware
+
+# [SETTINGS]
+PLAY_RATE = 20  # Setpoint updates per second
+
+class Waveform(object):
+    """Base waveform.
+
+    Subclasses define duration in seconds and value(t), the pressures at
+    times 0 <= t <= duration as a numpy array of the shape of t. Calling a
+    waveform clips t to that range.
+    """
+    duration = 0
+
+    def __call__(self, t):
+        return self.value(np.clip(t, 0, self.duration))
+
+class Constant(Waveform):
+    def __init__(self, level, duration=0):
+        self.level = level
+        self.duration = duration
+
+    def value(self, t):
+        return np.full(np.shape(t), self.level, dtype=float)
+
+class Ramp(Waveform):
+    """Linear ramp from start to end in duration seconds.
+    """
+    def __init__(self, start, end, duration):
+        self.start = start
+        self.end = end
+        self.duration = duration
+
+    def value(self, t):
+        if self.duration == 0:
+            return np.full(np.shape(t), self.end, dtype=float)
+        return self.start + (self.end - self.start) * np.asarray(t, dtype=float) / self.duration
+
+class Step(Waveform):
+    """Levels held for their durations in seconds.
+    """
+    def __init__(self, levels, durations):
+        if len(levels) != len(durations):
+            raise ValueError('One duration per step level.')
+        self.levels = np.asarray(levels, dtype=float)
+        self.edges = np.cumsum(durations)
+        self.duration = self.edges[-1]
+
+    def value(self, t):
+        idx = np.searchsorted(self.edges, t, side='right')
+        return self.levels[np.minimum(idx, len(self.levels) - 1)]
+
+class Sine(Waveform):
+    """Sine around offset with amplitude and period in seconds, phase in degrees.
+    """
+    def __init__(self, offset, amplitude, period, phase=0, duration=np.inf):
+        self.offset = offset
+        self.amplitude = amplitude
+        self.period = period
+        self.phase = np.radians(phase)
+        self.duration = duration
+
+    def value(self, t):
+        return self.offset + self.amplitude * np.sin(2 * np.pi * np.asarray(t, dtype=float) / self.period + self.phase)
+
+class Table(Waveform):
+    """Sample table, interpolated linearly or held until the next sample.
+    """
+    def __init__(self, times, values, hold=False):
+        self.times = np.asarray(times, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        if len(self.times) != len(self.values) or len(self.times) == 0:
+            raise ValueError('Table needs one value per time.')
+        self.hold = hold
+        self.duration = self.times[-1]
+
+    def value(self, t):
+        if self.hold:
+            idx = np.searchsorted(self.times, t, side='right') - 1
+            return self.values[np.maximum(idx, 0)]
+        return np.interp(t, self.times, self.values)
+
+class Spline(Table):
+    """Natural cubic spline through the samples of a table.
+    """
+    def __init__(self, times, values):
+        super(Spline, self).__init__(times, values)
+        x, y = self.times, self.values
+        h = np.diff(x)
+        # Second derivatives, zero at both ends
+        self._m = np.zeros(len(x))
+        if len(x) > 2:
+            a = np.diag(2 * (h[:-1] + h[1:])) + np.diag(h[1:-1], 1) + np.diag(h[1:-1], -1)
+            b = 6 * (np.diff(y[1:]) / h[1:] - np.diff(y[:-1]) / h[:-1])
+            self._m[1:-1] = np.linalg.solve(a, b)
+
+    def value(self, t):
+        if len(self.times) < 2:
+            return super(Spline, self).value(t)
+        x, y, m = self.times, self.values, self._m
+        idx = np.clip(np.searchsorted(x, t, side='right') - 1, 0, len(x) - 2)
+        h = x[idx+1] - x[idx]
+        dx = np.asarray(t, dtype=float) - x[idx]
+        slope = (y[idx+1] - y[idx]) / h - h * (2 * m[idx] + m[idx+1]) / 6
+        return y[idx] + slope * dx + m[idx] / 2 * dx**2 + (m[idx+1] - m[idx]) / (6 * h) * dx**3
+
+def load_csv(path, interval, channels=None, scale=1, time_column=False, hold=True):
+    """Load a table of pressures, one column per channel, like SmTest_5Codes.csv.
+
+    Parameters
+    ----------
+    path : str
+        CSV file with comma separated values.
+
+    interval : float
+        Seconds per row, ignored with time_column.
+
+    channels : list, optional
+        Channel number (1-based) per column, columns 1, 2, ... by default.
+
+    scale : float
+        Factor applied to all values, like a maximum pressure for fractions.
+
+    time_column : bool
+        The first column holds the row times in seconds.
+
+    hold : bool
+        Hold each row until the next, otherwise interpolate linearly.
+
+    Returns
+    -------
+    waveforms : dict
+        Table waveform per channel.
+    """
+    with open(path, 'rU') as csv_file:
+        data = np.loadtxt(csv_file, delimiter=',', ndmin=2)
+    if time_column:
+        times, data = data[:, 0], data[:, 1:]
+    else:
+        times = np.arange(len(data)) * interval
+    if channels is None:
+        channels = xrange(1, data.shape[1]+1)
+    if len(channels) != data.shape[1]:
+        raise ValueError('%d channels given for %d columns.' % (len(channels), data.shape[1]))
+    return dict((channel, Table(times, data[:, idx] * scale, hold)) for idx, channel in enumerate(channels))
+
+class Player(threading.Thread):
+    """Waveform playback thread.
+
+    Evaluates the waveforms of all channels at a fixed rate on an absolute
+    schedule, so timing errors do not accumulate, and sends them with one
+    set_pressures call per tick. A tick that is more than a period late is
+    skipped; the waveforms are evaluated at the actual time of each tick.
+
+    Parameters
+    ----------
+    setter : mfcs-ezWrapper.Load, flowRegulate.Regulator
+        Target with set_pressures().
+
+    waveforms : dict
+        Waveform per channel number (1-based).
+
+    rate : float
+        Setpoint updates per second.
+
+    unit : str, optional
+        Unit of the waveform values, the setter's unit by default.
+
+    loop : bool
+        Repeat from the start after the longest waveform ended.
+    """
+    def __init__(self, setter, waveforms, rate=PLAY_RATE, unit=None, loop=False):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.setter = setter
+        self.channels = sorted(waveforms)
+        self.waveforms = [waveforms[channel] for channel in self.channels]
+        self.period = 1 / rate
+        self.unit = unit
+        self.loop = loop
+        self.duration = max(waveform.duration for waveform in self.waveforms)
+        self._values = np.zeros(len(self.channels))
+        self._ticks = 0
+        self._missed = 0
+        self._stop = threading.Event()
+
+    def __repr__(self):
+        return repr(['Waveform player', self.channels, self.duration])
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    @property
+    def stats(self):
+        return {'ticks': self._ticks, 'missed': self._missed}
+
+    def values(self, t):
+        """Returns the setpoints of all channels at time t.
+        """
+        for idx, waveform in enumerate(self.waveforms):
+            self._values[idx] = waveform(t)
+        return self._values
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        hware.timing_thread(True)
+        try:
+            tick = 0
+            time_start = hware.clock()
+            while not self._stop.is_set():
+                deadline = time_start + tick * self.period
+                hware.sleep_until(deadline)
+                tick += 1
+                time_now = hware.clock()
+                if time_now - deadline > self.period:
+                    self._missed += 1
+                    continue
+                t = time_now - time_start
+                if t > self.duration:
+                    if self.loop and 0 < self.duration < np.inf:
+                        t %= self.duration
+                    else:
+                        # End on the final values of all waveforms
+                        self.setter.set_pressures(self.values(self.duration), self.channels, self.unit)
+                        break
+                self.setter.set_pressures(self.values(t), self.channels, self.unit)
+                self._ticks += 1
+        finally:
+            hware.timing_thread(False)
@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20150901
-# version update    : 20161019
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : Use as module
 # notes             : General functions wrapper for flow control. Must be the same for all flow control hardware!
@@ -26,16 +26,24 @@ import warnings
 import time
 # IO
 import ctypes  # Used for variable definition types
-from ctypes import cdll  # Used to load dynamic linked libraries
-mfcs_lib = cdll.LoadLibrary('flow/mfcs_64.dll')  # mfcs x64 library
+# Data
+import numpy as np
+# Project
+import hware
+import mfcsLib
+import flowUnits
 
 # [CONSTANTS]
-MBA2PSI = 0.0145037738007
-MBA2KPA = 0.1
+MBA2PSI = flowUnits.MBA2PSI
+MBA2KPA = flowUnits.MBA2KPA
 CHANNELS = 4
 ALPHA = 5
 P_LIMITS = {'mba':1034, 'psi':15, 'kpa':103.4}
-P_FACTORS = {'mba':1, 'psi':MBA2PSI, 'kpa':MBA2KPA}
+P_FACTORS = flowUnits.FACTORS
+
+# [SETTINGS]
+INIT_TIMEOUT = 2.0  # Seconds to wait for a unit to report ready after initialisation
+INIT_POLL = 0.02  # Seconds between status polls during initialisation
 
 class Load(object):
     """Fluigent MFCS-EZ wrapper for Microfluidics Control
@@ -44,19 +52,38 @@ class Load(object):
     ----------
     serials : str, list (of str)
         Serial(s) of MFCS-EZ controller(s) in strings (or list of strings).
+
+    library : str, optional
+        MFCS library, see mfcsLib.load: the vendor DLL by default or 'sim'
+        for the simulator. Set with "library" in `flowing` of hwareConfig.json.
+
+    sim : dict, optional
+        Simulator settings, see mfcsSim.Library. Set with "sim" in `flowing`
+        of hwareConfig.json.
     """
 
-    def __init__(self, serials, unit='mba'):
+    def __init__(self, serials, unit='mba', library=None, sim=None):
         if type(serials) is list:
             self._serials = serials
         else:
             self._serials = [serials]
         self._status = [None] * len(self._serials)
+        self._client = []
+        self._workers = []
         self._unit = unit
+        self._lib = mfcsLib.load(library, **(sim or {}))
         ## Handle variables
         self._serial_check = ctypes.c_ushort(0)  # Serial number handler
         self._status_check = ctypes.c_char()  # Status handler
         self._c_error = ctypes.c_char()  # Error handler
+        ## Sweep buffers, allocated on connect
+        self._c_pressures = None
+        self._c_timers = None
+        self._sweep_args = []
+        self._pressures = None
+        self._timers = None
+        self._sweep_time = None
+        self._setpoints = None
 
     def __repr__(self):
         """Returns client of the MFCS-EZ controller.
@@ -82,6 +109,28 @@ class Load(object):
     def error(self):
         return self._c_error
 
+    @property
+    def pressures(self):
+        """Returns the pressures in mbar of the last sweep, shared with the sweep buffer.
+        """
+        return self._pressures
+
+    @property
+    def timers(self):
+        """Returns the controller timer values of the last sweep, one per channel.
+        """
+        return self._timers
+
+    @property
+    def setpoints(self):
+        """Returns the pressures in mbar last set per channel.
+        """
+        return self._setpoints
+
+    @property
+    def sweep_time(self):
+        return self._sweep_time
+
     @property
     def unit(self):
         return self._unit
@@ -91,40 +140,50 @@ class Load(object):
 
     @property
     def limit(self):
-        return P_LIMITS[self._unit]
+        return self._unit_conv(P_LIMITS['mba'])
 
     @property
     def factor(self):
-        return P_FACTORS[self._unit]
+        return flowUnits.factor(self._unit)
 
     def connect(self):
         self._client = [None] * len(self._serials)
+        # One I/O worker per unit, all calls to a handle run on its worker
+        self._workers = [hware.Worker('MFCS-EZ %s' % serial) for serial in self._serials]
+        for worker in self._workers:
+            worker.start()
         print ('Initializng MFCS-EZ units')
-        for idx, serial in enumerate(self._serials):
-            self._client[idx] = mfcs_lib.mfcsez_initialisation(serial)
-        time.sleep(1)
+        futures = [worker.submit(self._init_func, serial) for worker, serial in zip(self._workers, self._serials)]
         # Check status
-        for idx, handle in enumerate(self._client):
-            self._c_error = mfcs_lib.mfcs_get_status(handle, ctypes.byref(self._status_check))
-            if ord(self._status_check.value) == 1:
+        for idx, future in enumerate(futures):
+            handle, self._c_error, status = future.result()
+            self._client[idx] = handle
+            if status == 1:
                 self._status[idx] = True
             if (handle != 0) & (self._status[idx] == 1):
-                self._c_error = mfcs_lib.mfcs_get_serial(handle, ctypes.byref(self._serial_check))
-                print('MFCS-EZ initialized: %s' % self._serial_check.value)
-                self._c_error = mfcs_lib.mfcs_set_alpha(handle, 0, ALPHA);   # Sends channel configuration
-            elif self._c_error == 0 and ord(self._status_check.value) == 0:
+                self._c_error, serial = self._workers[idx].call(self._setup_func, handle)
+                print('MFCS-EZ initialized: %s' % serial)
+            elif self._c_error == 0 and status == 0:
                 print('MFCS-EZ not primed. Push green button and restart.')
             else:
-                print('Error on MFCS-EZ initialisation: %s Status: %s' % (self._c_error, ord(self._status_check.value)) )
+                print('Error on MFCS-EZ initialisation: %s Status: %s' % (self._c_error, status) )
+        self._sweep_init()
 
     def close(self):
+        if self._lib is None:
+            return
         print("closing flow")
+        for worker in self._workers:
+            worker.stop()
+        for worker in self._workers:
+            worker.join(INIT_TIMEOUT)
+        self._workers = []
         try:
             for idx, handle in enumerate(self._client):
                 B_OK = bool(False)
-                self._c_error = mfcs_lib.mfcs_get_serial(handle, byref(self._serial_check))
+                self._c_error = self._lib.mfcs_get_serial(handle, ctypes.byref(self._serial_check))
                 # Close communication port 
-                B_OK = mfcs_lib.mfcs_close(handle)
+                B_OK = self._lib.mfcs_close(handle)
                 if (B_OK == True):
                     print ('Connection closed to serial: %s' % self._serial_check.value)
                 if (B_OK == False):
@@ -133,63 +192,178 @@ class Load(object):
             print('Flow hardware connection error: %s' % self._c_error)
         finally:
             # Release the DLL
-            ctypes.windll.kernel32.FreeLibrary(mfcs_lib._handle)
-            del mfcs_lib
-            print ('MFCS library unloaded')
+            mfcsLib.unload(self._lib)
+            self._lib = None
 
     # Base functions
+    def _init_func(self, serial):
+        """Initialise a unit and poll its status until ready or INIT_TIMEOUT.
+        """
+        handle = self._lib.mfcsez_initialisation(serial)
+        status = ctypes.c_char()
+        error = None
+        deadline = hware.clock() + INIT_TIMEOUT
+        while handle != 0:
+            error = self._lib.mfcs_get_status(handle, ctypes.byref(status))
+            if (error == 0 and ord(status.value) == 1) or hware.clock() > deadline:
+                break
+            time.sleep(INIT_POLL)
+        return handle, error, ord(status.value)
+
+    def _setup_func(self, handle):
+        serial_check = ctypes.c_ushort(0)
+        error = self._lib.mfcs_get_serial(handle, ctypes.byref(serial_check))
+        error = self._lib.mfcs_set_alpha(handle, 0, ALPHA) or error  # Sends channel configuration
+        return error, serial_check.value
+
     def _handle_select(self, num):
         handle_no = (int(num) - 1) // CHANNELS
         channel_no = int(num) - (CHANNELS * (handle_no) )
         return self._client[handle_no], int(channel_no)
 
-    def _pressure_func(self, num, value):
+    def _sweep_init(self):
+        """Allocate the sweep buffers: ctypes arrays that the DLL writes into
+        directly, shared with numpy arrays, and the prebuilt read arguments
+        for every channel of every handle.
+        """
+        channel_num = self.channel_num
+        self._c_pressures = (ctypes.c_float * channel_num)()
+        self._c_timers = (ctypes.c_ushort * channel_num)()
+        self._pressures = np.ctypeslib.as_array(self._c_pressures)
+        self._setpoints = np.zeros(channel_num)
+        self._timers = np.ctypeslib.as_array(self._c_timers)
+        float_size = ctypes.sizeof(ctypes.c_float)
+        ushort_size = ctypes.sizeof(ctypes.c_ushort)
+        # Pointers to the array elements, usable by the DLL and the simulator
+        self._sweep_args = []
+        for handle_no, handle in enumerate(self._client):
+            args = []
+            for c in xrange(1, CHANNELS+1):
+                idx = handle_no * CHANNELS + c - 1
+                args.append((handle, c, ctypes.pointer(ctypes.c_float.from_buffer(self._c_pressures, idx * float_size)),
+                             ctypes.pointer(ctypes.c_ushort.from_buffer(self._c_timers, idx * ushort_size))))
+            self._sweep_args.append(args)
+
+    def _read_handle(self, handle_no):
+        """Read all channels of one handle into the sweep buffers.
+        """
+        read_chan = self._lib.mfcs_read_chan
+        for args in self._sweep_args[handle_no]:
+            error = read_chan(*args)
+            if error != 0:
+                self._c_error = error
+
+    def _read_sweep(self):
+        """Read all handles in parallel on their workers.
+        """
+        futures = [worker.submit(self._read_handle, handle_no) for handle_no, worker in enumerate(self._workers)]
+        for future in futures:
+            future.result()
+        self._sweep_time = hware.clock()
+
+    def _set_func(self, num, value):
         h, c = self._handle_select(num)
-        self._c_error = mfcs_lib.mfcs_set_auto(h, c, ctypes.c_float(value) )
+        self._c_error = self._lib.mfcs_set_auto(h, c, ctypes.c_float(value) )
+        self._setpoints[int(num) - 1] = value
+
+    def _set_many_func(self, settings):
+        for num, value in settings:
+            self._set_func(num, value)
+
+    def _pressure_func(self, num, value):
+        self._workers[(int(num) - 1) // CHANNELS].call(self._set_func, num, value)
+
+    def _read_chan_func(self, num):
+        handle_no = (int(num) - 1) // CHANNELS
+        self._c_error = self._lib.mfcs_read_chan(*self._sweep_args[handle_no][(int(num) - 1) % CHANNELS])
+        return float(self._pressures[int(num) - 1])
 
     def _read_func(self, num):
-        pressure = ctypes.c_float()
-        timer = ctypes.c_ushort()
-        h, c = self._handle_select(num)
-        self._c_error = mfcs_lib.mfcs_read_chan(h, c, ctypes.pointer(pressure), ctypes.pointer(timer))
-        return pressure.value
+        return self._workers[(int(num) - 1) // CHANNELS].call(self._read_chan_func, num)
 
     def _unit_conv(self, pressure, set=False, unit=None):
+        """Convert mbar to the unit, or the unit to mbar with set=True. Lists stay lists.
+        """
         if unit is None:
             unit = self._unit
-        if unit == 'kpa':
-            unit_factor = MBA2KPA
-        elif unit == 'psi':
-            unit_factor = MBA2PSI
-        elif unit == 'mba':
-            unit_factor = 1
-        else:
-            raise AttributeError("Available units: millibar: 'mba'; kilopascal: 'kpa'; and pounds-per-sqaure-inch: 'psi'. %s" % sys.exc_info()[0])
         if set is True:
-            if type(pressure) is list:
-                return [p/unit_factor for p in pressure]
-            else:
-                return pressure/unit_factor
+            pressure_conv = flowUnits.to_mbar(pressure, unit)
         else:
-            if type(pressure) is list:
-                return [p*unit_factor for p in pressure]
-            else:
-                return pressure*unit_factor
+            pressure_conv = flowUnits.from_mbar(pressure, unit)
+        if type(pressure) is list:
+            return pressure_conv.tolist()
+        elif isinstance(pressure, np.ndarray):
+            return pressure_conv
+        return float(pressure_conv)
 
     # Minimum functions
+    def convert(self, pressures, unit=None):
+        """Returns mbar pressures, like setpoints or sweep pressures, in a unit; the current unit by default.
+        """
+        if unit is None:
+            unit = self._unit
+        return flowUnits.from_mbar(pressures, unit)
+
     def set_pressure(self, pressure=0, channel=None, unit=None):
         if unit is None:
             unit = self._unit
         if channel is None:
-            [self._pressure_func(channel, self._unit_conv(pressure, set=True, unit=unit)) for channel in xrange(self.channel_num)]
+            [self._pressure_func(channel, self._unit_conv(pressure, set=True, unit=unit)) for channel in xrange(1, self.channel_num+1)]
         else:
             self._pressure_func(channel, self._unit_conv(pressure, set=True, unit=unit))
 
+    def set_pressures(self, pressures, channels=None, unit=None):
+        """Set the pressures of several channels in one pass.
+
+        Pressures are clamped to 0 and the pressure limit; channels whose
+        setpoint does not change are not sent.
+
+        Parameters
+        ----------
+        pressures : list, numpy.ndarray
+            Pressures, one per channel.
+
+        channels : list, optional
+            Channel numbers (1-based) of the pressures, all channels by default.
+        """
+        if unit is None:
+            unit = self._unit
+        pressures = np.clip(flowUnits.to_mbar(pressures, unit), 0, P_LIMITS['mba'])
+        if channels is None:
+            channels = xrange(1, self.channel_num+1)
+        settings = [[] for worker in self._workers]
+        for channel, pressure in zip(channels, pressures):
+            if pressure != self._setpoints[int(channel) - 1]:
+                settings[(int(channel) - 1) // CHANNELS].append((channel, float(pressure)))
+        # Units are set in parallel on their workers
+        futures = [worker.submit(self._set_many_func, setting) for worker, setting in zip(self._workers, settings) if setting]
+        for future in futures:
+            future.result()
+
+    def read_sweep(self):
+        """Read all channels of all controllers in one sweep.
+
+        Returns
+        -------
+        sweep_time : float
+            hware.clock() time at the end of the sweep.
+
+        pressures : numpy.ndarray
+            Pressures in mbar, one per channel. The array is reused by the
+            next sweep; copy it to keep the values.
+
+        timers : numpy.ndarray
+            Controller timer values, one per channel.
+        """
+        self._read_sweep()
+        return self._sweep_time, self._pressures, self._timers
+
     def read_pressure(self, channel=None, unit=None):
         if unit is None:
             unit = self._unit
         if channel is None:
-            pressure = [self._read_func(channel) for channel in xrange(1,self.channel_num+1)]
+            self._read_sweep()
+            pressure = self._pressures.tolist()
         else:
             pressure = self._read_func(channel)
         return self._unit_conv(pressure, unit=unit)
\ No newline at end of file
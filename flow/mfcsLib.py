@@ -0,0 +1,57 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : mfcsLib.py
+# description       : Microfluidic Control - Flow module - MFCS-EZ library loader
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module, select with "library" in `flowing` of hwareConfig.json
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import sys
+import warnings
+# IO
+import ctypes  # Used for variable definition types
+from ctypes import cdll  # Used to load dynamic linked libraries
+# Project
+import mfcsSim
+
+# [SETTINGS]
+DLL_PATH = 'flow/mfcs_64.dll'  # mfcs x64 library
+
+def load(library=None, **settings):
+    """Load the MFCS-EZ library.
+
+    Parameters
+    ----------
+    library : str, optional
+        'dll' or None for the vendor DLL, 'sim' for mfcsSim.Library, or
+        the path of a compatible library.
+
+    settings : dict
+        Simulator settings, see mfcsSim.Library.
+    """
+    if library is None or library == 'dll':
+        return cdll.LoadLibrary(DLL_PATH)
+    elif library == 'sim':
+        return mfcsSim.Library(**settings)
+    return cdll.LoadLibrary(library)
+
+def unload(lib):
+    """Release a library loaded with load().
+    """
+    if isinstance(lib, ctypes.CDLL) and sys.platform == 'win32':
+        ctypes.windll.kernel32.FreeLibrary(lib._handle)
+        print ('MFCS library unloaded')
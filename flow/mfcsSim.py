@@ -0,0 +1,164 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : mfcsSim.py
+# description       : Microfluidic Control - Flow module - MFCS-EZ library simulator
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module, or with "library": "sim" in `flowing` of hwareConfig.json
+# notes             : Simulates the library functions used by mfcs-ezWrapper only.
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import math
+import time
+import random
+import warnings
+import threading
+# IO
+import ctypes
+# Project
+import hware
+
+# [SETTINGS]
+CHANNELS = 4  # Channels per unit
+READY_TIME = 0.1  # Seconds after initialisation before a unit reports ready
+
+def _target(arg):
+    """Returns the ctypes object of a byref() or pointer() argument.
+    """
+    if hasattr(arg, 'contents'):
+        return arg.contents
+    return arg._obj
+
+def _value(arg):
+    return getattr(arg, 'value', arg)
+
+class Unit(object):
+    """Simulated MFCS-EZ unit with a first-order pressure response per channel.
+    """
+    def __init__(self, serial):
+        self.serial = serial
+        self.ready = hware.clock() + READY_TIME
+        self.alpha = [0] * (CHANNELS+1)
+        self.setpoints = [0.0] * (CHANNELS+1)
+        self.pressures = [0.0] * (CHANNELS+1)
+        self.updated = hware.clock()
+
+    def update(self, tau):
+        time_now = hware.clock()
+        if tau > 0:
+            weight = 1 - math.exp(-(time_now - self.updated) / tau)
+        else:
+            weight = 1
+        self.pressures = [p + (s - p) * weight for p, s in zip(self.pressures, self.setpoints)]
+        self.updated = time_now
+
+class Library(object):
+    """Simulator of the Fluigent MFCS-EZ library.
+
+    Has the library functions used by mfcs-ezWrapper with the same
+    arguments and return codes, so the wrapper passes the same ctypes
+    arguments as to the vendor DLL. Channels follow the setpoint with a
+    first-order response; reads add gaussian noise.
+
+    Parameters
+    ----------
+    tau : float
+        Time constant in seconds of the pressure response.
+
+    noise : float
+        Standard deviation in mbar of the read pressures.
+
+    latency : float
+        Seconds added to every call.
+
+    jitter : float
+        Maximum seconds randomly added to or removed from the latency.
+    """
+    def __init__(self, tau=0.3, noise=0, latency=0, jitter=0):
+        self.tau = tau
+        self.noise = noise
+        self.latency = latency
+        self.jitter = jitter
+        self.units = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'MFCS-EZ library simulator %s' % sorted(self.units)
+
+    def _call(self, handle=None):
+        self.calls += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return self.units.get(handle)
+
+    # Library functions
+    def mfcsez_initialisation(self, serial):
+        self._call()
+        with self._lock:
+            handle = len(self.units) + 1
+            self.units[handle] = Unit(serial)
+        return handle
+
+    def mfcs_get_status(self, handle, status):
+        unit = self._call(handle)
+        if unit is None:
+            return 1
+        _target(status).value = b'\x01' if hware.clock() >= unit.ready else b'\x00'
+        return 0
+
+    def mfcs_get_serial(self, handle, serial):
+        unit = self._call(handle)
+        if unit is None:
+            return 1
+        _target(serial).value = int(unit.serial)
+        return 0
+
+    def mfcs_set_alpha(self, handle, channel, alpha):
+        unit = self._call(handle)
+        if unit is None:
+            return 1
+        channels = xrange(1, CHANNELS+1) if channel == 0 else [channel]
+        for c in channels:
+            unit.alpha[c] = _value(alpha)
+        return 0
+
+    def mfcs_set_auto(self, handle, channel, pressure):
+        unit = self._call(handle)
+        if unit is None or not 1 <= channel <= CHANNELS:
+            return 1
+        with self._lock:
+            unit.update(self.tau)
+            unit.setpoints[channel] = max(0.0, float(_value(pressure)))
+        return 0
+
+    def mfcs_read_chan(self, handle, channel, pressure, timer):
+        unit = self._call(handle)
+        if unit is None or not 1 <= channel <= CHANNELS:
+            return 1
+        with self._lock:
+            unit.update(self.tau)
+            value = unit.pressures[channel]
+        if self.noise:
+            value += random.gauss(0, self.noise)
+        _target(pressure).value = value
+        _target(timer).value = int(hware.clock() * 1000) & 0xFFFF
+        return 0
+
+    def mfcs_close(self, handle):
+        self._call(handle)
+        with self._lock:
+            return self.units.pop(handle, None) is not None
@@ -1 +1 @@
-import hwareMain
\ No newline at end of file
+from hwareMain import *
\ No newline at end of file
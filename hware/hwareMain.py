@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20160921
-# version update    : 20160921
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : As module
 # notes             : Do not quick fix functions for specific needs, keep them general!
@@ -20,5 +20,189 @@ from __future__ import division
 
 # [Modules]
 # General Python
+import sys
+import time
+import threading
 import warnings
+import Queue
 # Project
+
+# [SETTINGS]
+SPIN_TIME = 0.002  # Seconds before a deadline that sleep_until stops sleeping and spins
+THREAD_PRIORITY_TIME_CRITICAL = 15  # Windows thread priority for timing threads
+
+# Highest resolution clock for interval timing of hardware calls
+if hasattr(time, 'perf_counter'):
+    clock = time.perf_counter
+elif sys.platform == 'win32':
+    clock = time.clock
+else:
+    clock = time.time
+
+def sleep_until(deadline):
+    """Sleep until clock() reaches deadline.
+
+    Sleeps coarsely and spins for the last SPIN_TIME, so timing threads do
+    not depend on the resolution of the operating system sleep.
+    """
+    while True:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return
+        if remaining > SPIN_TIME:
+            time.sleep(remaining - SPIN_TIME)
+
+def timing_thread(enable=True):
+    """Raise the priority and timer resolution for the calling thread.
+
+    Only has effect on Windows, elsewhere the thread runs unchanged. Call
+    again with enable=False before the thread ends.
+    """
+    if sys.platform != 'win32':
+        return False
+    import ctypes
+    if enable:
+        ctypes.windll.winmm.timeBeginPeriod(1)
+        handle = ctypes.windll.kernel32.GetCurrentThread()
+        return bool(ctypes.windll.kernel32.SetThreadPriority(handle, THREAD_PRIORITY_TIME_CRITICAL))
+    ctypes.windll.winmm.timeEndPeriod(1)
+    return True
+
+def percentiles(values, points=(50, 90, 99)):
+    """Returns a dictionary of percentiles of a list of values.
+
+    Uses linear interpolation between the nearest ranks, like numpy's
+    default, and returns None for each percentile of an empty list.
+    """
+    values = sorted(values)
+    result = {}
+    for point in points:
+        key = 'p%g' % point
+        if not values:
+            result[key] = None
+            continue
+        rank = (len(values) - 1) * point / 100
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        result[key] = values[low] + (values[high] - values[low]) * (rank - low)
+    return result
+
+class Future(object):
+    """Result of a hardware request that is completed by another thread.
+
+    The requesting thread can wait on the result, so synchronous callers
+    like the GUI and scripts can use request functions that run on I/O
+    threads.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def __repr__(self):
+        if not self.done():
+            return '<Future pending>'
+        elif self._exception is not None:
+            return '<Future error: %r>' % self._exception
+        return '<Future result: %r>' % self._result
+
+    def done(self):
+        return self._event.is_set()
+
+    def add_done_callback(self, func):
+        """Call func(future) when done, or now if already done.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(func)
+                return
+        func(self)
+
+    def _finish(self, result=None, exception=None):
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._result = result
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            try:
+                func(self)
+            except Exception as e:
+                warnings.warn('Future callback failed: %s' % e)
+        return True
+
+    def set_result(self, result):
+        """Complete with result; returns False if already done.
+        """
+        return self._finish(result=result)
+
+    def set_exception(self, exception):
+        """Complete with error; returns False if already done.
+        """
+        return self._finish(exception=exception)
+
+    def exception(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise IOError('Hardware request timed out.')
+        return self._exception
+
+    def result(self, timeout=None):
+        """Wait for and return the result, or raise the request error.
+        """
+        if not self._event.wait(timeout):
+            raise IOError('Hardware request timed out.')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+class Worker(threading.Thread):
+    """I/O thread that runs the requests for one device in order.
+
+    Serves one device handle, so calls to different devices overlap while
+    calls to the same device never interleave, whichever thread makes them.
+
+    Parameters
+    ----------
+    name : str, optional
+        Thread name, like the device serial.
+    """
+    def __init__(self, name=None):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self._queue = Queue.Queue()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs); returns a Future of its result.
+        """
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the worker and wait for its result.
+        """
+        if threading.current_thread() is self:
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    def stop(self):
+        """Stop after the queued requests.
+        """
+        self._queue.put(None)
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            future, func, args, kwargs = request
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
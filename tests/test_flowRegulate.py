@@ -0,0 +1,98 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : test_flowRegulate.py
+# description       : Microfluidic Control - Tests - Closed-loop pressure regulation
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : python -m pytest tests
+# notes             : Runs the regulator against a simulated first-order plant on a simulated clock.
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import os
+import sys
+import math
+import warnings
+# Data
+import numpy as np
+# Project
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'flow')]
+import flowRegulate
+
+# [SETTINGS]
+TAU = 0.3  # Plant time constant in seconds
+LIMIT = 6900  # Pressure limit in mbar
+
+class Plant(object):
+    """Flow control with a first-order pressure response, like mfcs-ezWrapper.Load.
+    """
+    def __init__(self, channel_num=1):
+        self.channel_num = channel_num
+        self.limit = LIMIT
+        self.setpoints = np.zeros(channel_num)
+        self.pressures = np.zeros(channel_num)
+
+    def _unit_conv(self, pressure, set=False, unit=None):
+        return pressure
+
+    def _pressure_func(self, channel, pressure):
+        self.setpoints[channel-1] = pressure
+
+    def set_pressures(self, pressures, channels, unit=None):
+        self.setpoints[np.asarray(channels) - 1] = pressures
+
+    def read_sweep(self):
+        return 0, self.pressures, None
+
+    def advance(self, dt):
+        self.pressures += (self.setpoints - self.pressures) * (1 - math.exp(-dt / TAU))
+
+def step_response(monkeypatch, target, slew, duration=10.0):
+    """Returns the regulator and the peak pressure of a step from zero to target.
+    """
+    clock = [0.0]
+    monkeypatch.setattr(flowRegulate.hware, 'clock', lambda: clock[0])
+    plant = Plant()
+    regulator = flowRegulate.Regulator(plant, slew=slew)
+    regulator.enable()
+    regulator.set_pressure(target)
+    peak = 0.0
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        for tick in xrange(int(duration / regulator.period)):
+            clock[0] += regulator.period
+            plant.advance(regulator.period)
+            regulator.step()
+            peak = max(peak, plant.pressures[0])
+    return regulator, peak
+
+def test_slew_limited_step_overshoot(monkeypatch):
+    target = 500.0
+    regulator, peak = step_response(monkeypatch, target, slew=flowRegulate.SLEW)
+    assert (peak - target) / target < 0.10
+    metrics = regulator.metrics[0]
+    assert len(metrics) == 1
+    assert metrics[0]['settle_time'] is not None
+    assert metrics[0]['overshoot'] < 10
+
+def test_set_pressures_scalar():
+    plant = Plant(channel_num=4)
+    regulator = flowRegulate.Regulator(plant)
+    regulator.enable(channel=1)
+    regulator.set_pressures(100.0)
+    assert regulator.targets.tolist() == [100.0] * 4
+    assert plant.setpoints.tolist() == [0.0, 100.0, 100.0, 100.0]
+    regulator.set_pressures(50.0, channels=[2, 4])
+    assert regulator.targets.tolist() == [100.0, 50.0, 100.0, 50.0]
@@ -0,0 +1,498 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : modbusTcp.py
+# description       : Microfluidic Control - Valve module - Pipelined Modbus/TCP client
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module
+# notes             : Only the coil functions used for valving are implemented.
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import sys
+import time
+import warnings
+import socket
+import struct
+import threading
+from collections import deque
+# Project
+import hware
+
+# [CONSTANTS]
+MODBUS_PORT = 502
+READ_COILS = 0x01
+WRITE_COIL = 0x05
+WRITE_COILS = 0x0F
+MBAP_HEADER = '>HHHB'  # Transaction ID, protocol ID, length, unit ID
+MBAP_SIZE = struct.calcsize(MBAP_HEADER)
+EXCEPTION_FLAG = 0x80
+
+# [SETTINGS]
+TIMEOUT = 2.0  # Seconds to wait for a reply
+WINDOW = 8  # Maximum number of transactions in flight
+RETRIES = 3  # Times a request is replayed after reconnecting
+BACKOFF = (0.1, 5.0)  # Minimum and maximum seconds between reconnect attempts
+KEEPALIVE = (5, 1, 3)  # TCP keepalive idle seconds, probe interval seconds and probe count
+RTT_HISTORY = 1000  # Number of round trip times kept for the statistics
+
+class ModbusError(IOError):
+    """Modbus exception reply or transport error."""
+    pass
+
+# Protocol data units
+def pack_bits(bits):
+    data = bytearray((len(bits) + 7) // 8)
+    for idx, bit in enumerate(bits):
+        if bit:
+            data[idx // 8] |= 1 << (idx % 8)
+    return bytes(data)
+
+def unpack_bits(data, count):
+    data = bytearray(data)
+    return [bool(data[idx // 8] & (1 << (idx % 8))) for idx in range(count)]
+
+def read_coils_pdu(address, count):
+    return struct.pack('>BHH', READ_COILS, address, count)
+
+def write_coil_pdu(address, state):
+    return struct.pack('>BHH', WRITE_COIL, address, 0xFF00 if state else 0x0000)
+
+def write_coils_pdu(address, states):
+    data = pack_bits(states)
+    return struct.pack('>BHHB', WRITE_COILS, address, len(states), len(data)) + data
+
+def frame(tid, pdu, unit=0):
+    return struct.pack(MBAP_HEADER, tid, 0, len(pdu) + 1, unit) + pdu
+
+def check_pdu(pdu):
+    """Raise ModbusError for exception replies, else return the PDU.
+    """
+    function = bytearray(pdu[:1])[0]
+    if function & EXCEPTION_FLAG:
+        code = bytearray(pdu[1:2])[0]
+        raise ModbusError('Modbus exception %d on function %d.' % (code, function & ~EXCEPTION_FLAG))
+    return pdu
+
+class Connection(object):
+    """Managed pipelined Modbus/TCP client
+
+    Requests are written to the socket as soon as a transaction slot is
+    free and return a hware.Future. A reader thread matches the replies to
+    the requests by transaction ID, so up to `window` requests are in
+    flight at the same time.
+
+    The socket uses TCP keepalive, so a dead controller is noticed while
+    idle. When the connection drops, it is reopened in the background with
+    exponential backoff and requests in flight are replayed, up to
+    `RETRIES` times. Replaying is safe for valving: coil reads and absolute
+    coil writes are idempotent. Requests made while reconnecting are sent
+    once the connection is back, or fail when their caller stops waiting.
+
+    Parameters
+    ----------
+    host : str
+        IP address of the Modbus/TCP server.
+
+    port : int
+        Modbus/TCP port.
+
+    window : int
+        Maximum number of requests in flight.
+    """
+    def __init__(self, host, port=MODBUS_PORT, unit=0, window=WINDOW, timeout=TIMEOUT):
+        self._host = host
+        self._port = port
+        self._unit = unit
+        self._timeout = timeout
+        self._socket = None
+        self._open = False
+        self._reconnecting = False
+        self._tid = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._slots = window  # Free transaction slots
+        self._slot_free = threading.Condition(threading.Lock())
+        # Health counters, updated under _lock
+        self._transactions = 0
+        self._failed = 0
+        self._reconnects = 0
+        self._rtt = deque(maxlen=RTT_HISTORY)
+
+    def __repr__(self):
+        return 'Modbus/TCP %s:%s' % (self._host, self._port)
+
+    @property
+    def connected(self):
+        return self._socket is not None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def stats(self):
+        """Returns connection health counters and round trip percentiles in seconds.
+        """
+        with self._lock:
+            stats = {'connected': self.connected,
+                     'transactions': self._transactions,
+                     'failed': self._failed,
+                     'reconnects': self._reconnects,
+                     'pending': len(self._pending)}
+            rtt = list(self._rtt)
+        stats['rtt'] = hware.percentiles(rtt)
+        return stats
+
+    def connect(self):
+        try:
+            sock = self._open_socket()
+        except socket.error as e:
+            return e
+        with self._lock:
+            self._socket = sock
+            self._open = True
+        self._start_reader(sock)
+        return True
+
+    def close(self):
+        self._open = False
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+        self._fail_pending(ModbusError('Modbus connection closed.'))
+
+    # Base functions
+    def _open_socket(self):
+        sock = socket.create_connection((self._host, self._port), self._timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._keepalive(sock)
+        return sock
+
+    def _start_reader(self, sock):
+        """Start the reply reader of a socket.
+
+        Only call after publishing the socket as self._socket, so _lost
+        recognises it if the connection drops right away.
+        """
+        reader = threading.Thread(target=self._read_loop, args=(sock,))
+        reader.daemon = True
+        reader.start()
+
+    @staticmethod
+    def _keepalive(sock):
+        idle, interval, count = KEEPALIVE
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if sys.platform == 'win32':
+            sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+        elif hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+    def _next_tid(self):
+        self._tid = (self._tid % 0xFFFF) + 1
+        while self._tid in self._pending:
+            self._tid = (self._tid % 0xFFFF) + 1
+        return self._tid
+
+    def _complete(self, request, result=None, error=None):
+        future = request[0]
+        if error is None:
+            done = future.set_result(result)
+        else:
+            done = future.set_exception(error)
+            with self._lock:
+                self._failed += 1
+        if done:
+            self._release_slot()
+
+    def _acquire_slot(self, deadline):
+        """Wait for a free transaction slot until the deadline; returns False if none came free.
+
+        A Condition with timeout, as Python 2 semaphores cannot wait with a timeout.
+        """
+        with self._slot_free:
+            while self._slots == 0:
+                remaining = deadline - hware.clock()
+                if remaining <= 0:
+                    return False
+                self._slot_free.wait(remaining)
+            self._slots -= 1
+            return True
+
+    def _release_slot(self):
+        with self._slot_free:
+            self._slots += 1
+            self._slot_free.notify()
+
+    def _fail_pending(self, error):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for request in pending.values():
+            self._complete(request, error=error)
+
+    def _recv(self, sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise socket.error('Modbus connection closed by peer.')
+            data += chunk
+        return data
+
+    def _read_loop(self, sock):
+        try:
+            while True:
+                tid, protocol, length, unit = struct.unpack(MBAP_HEADER, self._recv(sock, MBAP_SIZE))
+                pdu = self._recv(sock, length - 1)
+                with self._lock:
+                    request = self._pending.pop(tid, None)
+                    if request is not None:
+                        self._transactions += 1
+                        self._rtt.append(hware.clock() - request[3])
+                if request is None:
+                    warnings.warn('Modbus reply for unknown transaction %d.' % tid)
+                    continue
+                try:
+                    result = request[1](check_pdu(pdu))
+                except Exception as e:
+                    self._complete(request, error=e)
+                else:
+                    self._complete(request, result)
+        except (socket.error, struct.error) as e:
+            self._lost(sock, e)
+
+    def _lost(self, sock, error):
+        """Drop a failed socket and start reconnecting.
+        """
+        with self._lock:
+            if sock is not self._socket:
+                return
+            self._socket = None
+            if not self._open or self._reconnecting:
+                return
+            self._reconnecting = True
+        sock.close()
+        warnings.warn('Modbus connection to %s lost: %s' % (self._host, error))
+        reconnect = threading.Thread(target=self._reconnect_loop)
+        reconnect.daemon = True
+        reconnect.start()
+
+    def _reconnect_loop(self):
+        backoff = BACKOFF[0]
+        while self._open:
+            try:
+                sock = self._open_socket()
+            except socket.error:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF[1])
+                continue
+            with self._lock:
+                self._reconnecting = False
+                if not self._open:
+                    sock.close()
+                    return
+                self._socket = sock
+                self._reconnects += 1
+            self._start_reader(sock)
+            print('Modbus connection to %s restored.' % self._host)
+            self._replay(sock)
+            return
+        self._reconnecting = False
+
+    def _replay(self, sock):
+        """Resend all requests in flight on a new socket.
+        """
+        failed = []
+        with self._lock:
+            for tid in sorted(self._pending):
+                request = self._pending[tid]
+                if request[4] >= RETRIES:
+                    failed.append(self._pending.pop(tid))
+                    continue
+                self._pending[tid] = request[:3] + (hware.clock(), request[4] + 1)
+                try:
+                    sock.sendall(frame(tid, request[2], self._unit))
+                except socket.error:
+                    break
+        for request in failed:
+            self._complete(request, error=ModbusError('Modbus request failed after %d retries.' % RETRIES))
+
+    def request(self, pdu, decode=None):
+        """Send a PDU and return a future for the decoded reply.
+        """
+        future = hware.Future()
+        if not self._open:
+            future.set_exception(ModbusError('Modbus connection not open.'))
+            return future
+        if not self._acquire_slot(hware.clock() + self._timeout):
+            with self._lock:
+                self._failed += 1
+            future.set_exception(ModbusError('No Modbus transaction slot free.'))
+            return future
+        with self._lock:
+            tid = self._next_tid()
+            future.tid = tid
+            self._pending[tid] = (future, decode or (lambda pdu: pdu), pdu, hware.clock(), 0)
+            sock = self._socket
+            if sock is not None:
+                try:
+                    sock.sendall(frame(tid, pdu, self._unit))
+                except socket.error:
+                    sock = None
+        if sock is None and self._socket is not None:
+            self._lost(self._socket, 'send failed')
+        return future
+
+    def cancel(self, future, error=None):
+        """Remove a request that is no longer waited on.
+        """
+        with self._lock:
+            request = self._pending.pop(getattr(future, 'tid', None), None)
+        if request is not None:
+            self._complete(request, error=error or ModbusError('Modbus request cancelled.'))
+
+    def wait(self, future):
+        """Wait for a request result; fail the request on timeout.
+        """
+        try:
+            return future.result(self._timeout)
+        except IOError:
+            self.cancel(future, ModbusError('Modbus request timed out.'))
+            raise
+
+    # Minimum functions
+    def read_coils(self, address, count):
+        return self.request(read_coils_pdu(address, count), lambda pdu: unpack_bits(pdu[2:], count))
+
+    def write_coil(self, address, state):
+        return self.request(write_coil_pdu(address, state), lambda pdu: True)
+
+    def write_coils(self, address, states):
+        return self.request(write_coils_pdu(address, states), lambda pdu: True)
+
+class SyncConnection(object):
+    """Modbus/TCP connection through the pymodbus sync client
+
+    Has the functions of Connection, so the Wago wrappers can use either.
+    Requests run one at a time on the calling thread and return a completed
+    hware.Future. There is no keepalive, reconnect or replay; pymodbus
+    reopens the socket on the next request.
+
+    Parameters
+    ----------
+    host : str
+        IP address of the Modbus/TCP server.
+
+    port : int
+        Modbus/TCP port.
+    """
+    def __init__(self, host, port=MODBUS_PORT, unit=0, timeout=TIMEOUT):
+        from pymodbus.client.sync import ModbusTcpClient  # Optional, only needed for this client
+        self._host = host
+        self._port = port
+        self._unit = unit
+        self._timeout = timeout
+        self._client = ModbusTcpClient(host, port=port, timeout=timeout)
+        self._lock = threading.Lock()
+        # Health counters, updated under _lock
+        self._transactions = 0
+        self._failed = 0
+        self._rtt = deque(maxlen=RTT_HISTORY)
+
+    def __repr__(self):
+        return 'Modbus/TCP (pymodbus) %s:%s' % (self._host, self._port)
+
+    @property
+    def connected(self):
+        return self._client.socket is not None
+
+    @property
+    def pending(self):
+        return 0
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def stats(self):
+        """Returns connection health counters and round trip percentiles in seconds.
+        """
+        with self._lock:
+            stats = {'connected': self.connected,
+                     'transactions': self._transactions,
+                     'failed': self._failed,
+                     'reconnects': 0,
+                     'pending': 0}
+            rtt = list(self._rtt)
+        stats['rtt'] = hware.percentiles(rtt)
+        return stats
+
+    def connect(self):
+        if self._client.connect():
+            return True
+        return ModbusError('Could not connect to %s:%s.' % (self._host, self._port))
+
+    def close(self):
+        self._client.close()
+
+    # Base functions
+    def _run(self, func, decode):
+        future = hware.Future()
+        with self._lock:
+            time_start = hware.clock()
+            try:
+                reply = func()
+                if isinstance(reply, Exception):
+                    raise ModbusError(str(reply))
+                if getattr(reply, 'function_code', 0) & EXCEPTION_FLAG:
+                    raise ModbusError('Modbus exception %s on function %d.' % (getattr(reply, 'exception_code', '?'), reply.function_code & ~EXCEPTION_FLAG))
+                result = decode(reply)
+            except Exception as e:
+                self._failed += 1
+                future.set_exception(e if isinstance(e, IOError) else ModbusError(str(e)))
+                return future
+            self._transactions += 1
+            self._rtt.append(hware.clock() - time_start)
+        future.set_result(result)
+        return future
+
+    def cancel(self, future, error=None):
+        pass
+
+    def wait(self, future):
+        return future.result(self._timeout)
+
+    # Minimum functions
+    def read_coils(self, address, count):
+        return self._run(lambda: self._client.read_coils(address, count, unit=self._unit),
+                         lambda reply: list(reply.bits[:count]))
+
+    def write_coil(self, address, state):
+        return self._run(lambda: self._client.write_coil(address, bool(state), unit=self._unit), lambda reply: True)
+
+    def write_coils(self, address, states):
+        return self._run(lambda: self._client.write_coils(address, [bool(state) for state in states], unit=self._unit),
+                         lambda reply: True)
@@ -0,0 +1,161 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : valveBench.py
+# description       : Microfluidic Control - Valve module - Valve latency benchmark
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : python -m valve.valveBench --profile sim --output bench.json
+# notes             : Switches valves! Only run on hardware without a chip connected.
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import sys
+import json
+import argparse
+import importlib
+# Project
+import config as cfg
+import hware
+
+# [SETTINGS]
+REPEAT = 100  # Measurements per benchmark
+TOGGLE_TIME = 2.0  # Seconds per sustained toggle rate benchmark
+PERCENTILES = (50, 90, 99)
+
+def summary(times):
+    """Returns count, mean, percentiles and maximum of a list of times in seconds.
+    """
+    result = {'n': len(times), 'mean': sum(times) / len(times), 'max': max(times)}
+    result.update(hware.percentiles(times, PERCENTILES))
+    return result
+
+def timed(func, repeat):
+    times = []
+    for idx in xrange(repeat):
+        time_start = hware.clock()
+        func(idx)
+        times.append(hware.clock() - time_start)
+    return summary(times)
+
+def toggle_rate(func, duration):
+    """Returns the number of calls per second of func(state) with alternating states.
+    """
+    count = 0
+    time_start = hware.clock()
+    while hware.clock() - time_start < duration:
+        func(count % 2 == 0)
+        count += 1
+    return count / (hware.clock() - time_start)
+
+class Bench(object):
+    """Valve latency benchmarks for any valving backend.
+
+    Measures the public functions of the valve control, so the numbers are
+    what the GUI and scripts get.
+
+    Parameters
+    ----------
+    control : wagoWrapper.Load
+        Connected valve control.
+
+    valve : int
+        Valve used for the single valve benchmarks.
+    """
+    def __init__(self, control, valve=0, repeat=REPEAT, toggle_time=TOGGLE_TIME):
+        self.control = control
+        self.valve = valve
+        self.repeat = repeat
+        self.toggle_time = toggle_time
+        self.bank = list(xrange(control.valve_num))
+
+    # Per valve path: one write_coil request per valve
+    def single_set(self, idx):
+        self.control.valve_set(idx % 2 == 0, self.valve)
+
+    def bank_single(self, idx):
+        for num in self.bank:
+            self.control.valve_set(idx % 2 == 0, num)
+
+    # Batched path: one write_coils request per change
+    def bank_set(self, idx):
+        self.control.valve_set_many(self.bank, idx % 2 == 0)
+
+    def read(self, idx):
+        self.control.update(verify=True)
+
+    def pipelined_rate(self):
+        """Returns toggles per second with requests in flight, counted until all replies are in.
+        """
+        futures = []
+        time_start = hware.clock()
+        while hware.clock() - time_start < self.toggle_time:
+            futures.append(self.control.valve_set_async(len(futures) % 2 == 0, self.valve))
+        self.control.wait(futures)
+        return len(futures) / (hware.clock() - time_start)
+
+    def run(self):
+        results = {'latency': {}, 'toggle_rate': {}}
+        latency = results['latency']
+        latency['single_set'] = timed(self.single_set, self.repeat)
+        latency['bank_single'] = timed(self.bank_single, max(1, self.repeat // 10))
+        latency['bank_set'] = timed(self.bank_set, self.repeat)
+        latency['read'] = timed(self.read, self.repeat)
+        rate = results['toggle_rate']
+        rate['single_set'] = toggle_rate(lambda state: self.control.valve_set(state, self.valve), self.toggle_time)
+        rate['bank_set'] = toggle_rate(lambda state: self.control.valve_set_many(self.bank, state), self.toggle_time)
+        if hasattr(self.control, 'valve_set_async'):
+            rate['pipelined'] = self.pipelined_rate()
+            self.control.update(verify=True)
+        self.control.valve_set(False)
+        return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Valve actuation latency benchmark. Switches valves!')
+    parser.add_argument('--profile', help='Hardware profile in hwareConfig.json, default from mainConfig.json')
+    parser.add_argument('--chip', default=cfg.CHIPS_DEFAULT, help='Chip configuration for valve names')
+    parser.add_argument('--valve', type=int, default=0, help='Valve for the single valve benchmarks')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='Measurements per benchmark')
+    parser.add_argument('--toggle-time', type=float, default=TOGGLE_TIME, help='Seconds per toggle rate benchmark')
+    parser.add_argument('--output', help='JSON results file, default prints to stdout')
+    args = parser.parse_args(argv)
+
+    config = cfg.ConfigHandler(args.chip)
+    profile = args.profile or config.main['profile']['hardware']
+    config.hware = cfg.FileLoad(cfg.HARDWARE_FOLDER, 'hwareConfig.json')[profile]
+    hardware = config.hware['valving']['hardware']
+    valve_module = importlib.import_module("valve."+hardware+"Wrapper")
+    control = valve_module.Load(config)
+    control.connect()
+    try:
+        if control.status is None:
+            print('Valve hardware not available for profile %s.' % profile)
+            return 1
+        results = Bench(control, args.valve, args.repeat, args.toggle_time).run()
+        results.update({'profile': profile,
+                        'hardware': hardware,
+                        'config': list(config.hware['valving']['config']),
+                        'health': control.health})
+    finally:
+        control.close()
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as json_file:
+            json_file.write(output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
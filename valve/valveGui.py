@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20160308
-# version update    : 20160901
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : As module
 # notes             : Do not quick fix functions for specific needs, keep them general!
@@ -21,7 +21,7 @@ from __future__ import division
 # [Modules]
 # General Python
 import warnings
-import thread
+import threading
 # GUI
 import wx
 import wx.lib.scrolledpanel
@@ -49,6 +49,8 @@ class MainWindow(wx.Frame):
         self.control = control
 
         self.current_chip = self.config.chip.name
+        self._pending_changes = {}
+        self._pending_lock = threading.Lock()
 
         # Window Size/Postion Handler
         self.window_position = config.WindowPosition(self, self.config.main)
@@ -65,6 +67,7 @@ class MainWindow(wx.Frame):
         valveTabs = wx.Notebook(self)
 
         # Chip Tab
+        self.chipImageTab = None
         if self.config.chip.name != DEFAULT_CHIP:
             self.chipImageTab = ChipTab(valveTabs, self.chip_size, self.config.chip)
             valveTabs.AddPage(self.chipImageTab, u"Chip", False)
@@ -88,7 +91,14 @@ class MainWindow(wx.Frame):
         self.Bind(wx.EVT_MOVE, self.update)
         self.Bind(wx.EVT_CLOSE, self.close)
 
-        thread.start_new_thread(self.toggle_check, ())
+        # Valve buttons per valve number, updated from valve state changes
+        self.valve_buttons = {}
+        for valve_no in xrange(self.control.valve_num):
+            buttons = [self.valveTab.FindWindowByName("valveBtn%02d" % valve_no)]
+            if self.chipImageTab is not None:
+                buttons.append(self.chipImageTab.FindWindowByName("chipBtn%02d" % valve_no))
+            self.valve_buttons[valve_no] = [btn for btn in buttons if btn is not None]
+        self.control.subscribe(self.valves_changed)
 
     def __del__(self):
         self.Close()
@@ -99,6 +109,7 @@ class MainWindow(wx.Frame):
     def show(self, event):
         if self.current_chip != self.config.chip.name:
             self.Show(False)
+            self.control.unsubscribe(self.valves_changed)
             self.DestroyChildren()
             self.current_chip = self.config.chip.name
             self.init()
@@ -115,33 +126,27 @@ class MainWindow(wx.Frame):
         valve_no = filter( str.isdigit, str(o.GetLabel()) )
         state = o.GetValue()
         self.control.valve_set(state, int(valve_no))
-        thread.start_new_thread(self.toggle_check, ())
 
-    def toggle_checker(self, valve_no):
-        name_c = "chipBtn%02d" % valve_no
-        try:
-            btn_id_chip = self.chipImageTab.FindWindowByName( name_c )
-            if self.control.status[valve_no] == True:
-                btn_id_chip.SetValue(True)
-                btn_id_chip.SetBackgroundColour(VALVE_OPENED_COLOR)
-            else:
-                btn_id_chip.SetValue(False)
-                btn_id_chip.SetBackgroundColour(VALVE_CLOSED_COLOR)
-        except AttributeError:
-            pass
-        name_v = "valveBtn%02d" % valve_no
-        btn_id_valve = self.valveTab.FindWindowByName( name_v )
-        if self.control.status[valve_no] == True:
-            btn_id_valve.SetValue(True)
-            btn_id_valve.SetBackgroundColour(VALVE_OPENED_COLOR)
-        else:
-            btn_id_valve.SetValue(False)
-            btn_id_valve.SetBackgroundColour(VALVE_CLOSED_COLOR)
-
-    def toggle_check(self):
-        self.control.update()
-        valves = xrange(self.control.valve_num)
-        map(self.toggle_checker, valves)
+    def valves_changed(self, changes):
+        """Valve state subscriber; collects changes from any thread and
+        applies them on the GUI thread in one batch.
+        """
+        with self._pending_lock:
+            schedule = not self._pending_changes
+            self._pending_changes.update(changes)
+        if schedule:
+            wx.CallAfter(self.apply_changes)
+
+    def apply_changes(self):
+        with self._pending_lock:
+            changes, self._pending_changes = self._pending_changes, {}
+        for valve_no, state in changes.items():
+            for btn in self.valve_buttons.get(valve_no, []):
+                btn.SetValue(state)
+                if state == True:
+                    btn.SetBackgroundColour(VALVE_OPENED_COLOR)
+                else:
+                    btn.SetBackgroundColour(VALVE_CLOSED_COLOR)
 
 class ChipTab(wx.Panel):
     def __init__(self, parent=None, size=None, chip_config=None):
@@ -403,7 +408,7 @@ class ValveTab(wx.ScrolledWindow):
         o = event.GetEventObject()
         valve_no = filter( str.isdigit, str(o.GetName()) )
         value = o.GetValue()
-        self.chip['valves'][valve_no]['name'] = value
+        self.Parent.Parent.control.valve_rename(valve_no, value)
         self.chip.update()
 
 
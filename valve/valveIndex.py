@@ -0,0 +1,108 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : valveIndex.py
+# description       : Microfluidic Control - Valve module - Valve name index
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import warnings
+
+class ValveIndex(object):
+    """Valve name to valve number index of a chip configuration.
+
+    Names are matched exactly; script style names in brackets, like
+    '[Mx2Out]', are accepted as well. Empty names are not indexed.
+
+    Parameters
+    ----------
+    chip : config.Chip
+        Chip configuration with the 'valves' of chipConfig.json.
+    """
+    def __init__(self, chip):
+        self._chip = chip
+        self.build()
+
+    def __repr__(self):
+        return repr(self._index)
+
+    def __getitem__(self, name):
+        return self.lookup(name)
+
+    def __contains__(self, name):
+        try:
+            self.lookup(name)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    @property
+    def duplicates(self):
+        """Returns names that are used by more than one valve.
+        """
+        return dict((name, sorted(nums)) for name, nums in self._index.items() if len(nums) > 1)
+
+    @staticmethod
+    def _strip(name):
+        if name.startswith('[') and name.endswith(']'):
+            return name[1:-1]
+        return name
+
+    def _add(self, num, name):
+        self._names[num] = name
+        if name:
+            self._index.setdefault(name, set()).add(num)
+
+    def _remove(self, num):
+        name = self._names.pop(num, None)
+        if name:
+            self._index[name].discard(num)
+            if not self._index[name]:
+                del self._index[name]
+
+    def build(self):
+        """Build the index from the chip configuration.
+        """
+        self._chip_name = self._chip.name
+        self._names = {}
+        self._index = {}
+        for valve_no, valve in self._chip['valves'].items():
+            self._add(int(valve_no), valve['name'])
+        if self.duplicates:
+            warnings.warn("Duplicate valve names in chip '%s': %s" % (self._chip_name, self.duplicates))
+
+    def rename(self, num, name):
+        """Update the index for a renamed valve.
+        """
+        self._remove(int(num))
+        self._add(int(num), name)
+        if len(self._index.get(name, ())) > 1:
+            warnings.warn("Duplicate valve name '%s': valves %s" % (name, sorted(self._index[name])))
+
+    def lookup(self, name):
+        """Returns the valve number of a valve name.
+        """
+        if self._chip.name != self._chip_name:
+            self.build()
+        name = self._strip(name)
+        nums = self._index.get(name)
+        if not nums:
+            raise KeyError("Unknown valve name: '%s'" % name)
+        if len(nums) > 1:
+            raise ValueError("Ambiguous valve name '%s': valves %s" % (name, sorted(nums)))
+        for num in nums:
+            return num
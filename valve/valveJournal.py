@@ -0,0 +1,166 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : valveJournal.py
+# description       : Microfluidic Control - Valve module - Valve transition journal
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import os
+import time
+import warnings
+import threading
+# Data
+import numpy as np
+# Project
+import hware
+
+# [CONSTANTS]
+COMMANDED = 0  # Coil states written to the controller
+CONFIRMED = 1  # Coil states read back from the controller
+ORIGIN = 255  # First record: clock time and wall time in microseconds (in 'state')
+RECORD = np.dtype([('time', '<f8'), ('kind', 'u1'), ('state', '<u8'), ('changed', '<u8')])
+MAX_VALVES = 64  # Valves that fit in one record
+
+def register2mask(register):
+    mask = 0
+    for idx, state in enumerate(register):
+        if state:
+            mask |= 1 << idx
+    return mask
+
+def mask2register(mask, valve_num):
+    return [bool((int(mask) >> idx) & 1) for idx in xrange(valve_num)]
+
+class Journal(object):
+    """Append-only valve transition journal.
+
+    Every change of the commanded or confirmed coil states is appended as a
+    fixed size record: clock time, kind, all coil states as a bitmask and
+    the bitmask of the coils that changed. Unchanged states are not
+    recorded.
+
+    Parameters
+    ----------
+    path : str
+        Journal file, appended to if it exists.
+
+    valve_num : int
+        Number of valves, at most MAX_VALVES.
+    """
+    def __init__(self, path, valve_num):
+        if valve_num > MAX_VALVES:
+            raise ValueError('Valve journal holds at most %d valves.' % MAX_VALVES)
+        self._path = path
+        self._valve_num = valve_num
+        self._last = {COMMANDED: None, CONFIRMED: None}
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        self._write(hware.clock(), ORIGIN, int(time.time() * 1e6), 0)
+
+    def __repr__(self):
+        return repr(['Valve journal', self._path])
+
+    @property
+    def path(self):
+        return self._path
+
+    def _write(self, timestamp, kind, state, changed):
+        record = np.array([(timestamp, kind, state, changed)], dtype=RECORD)
+        self._file.write(record.tobytes())
+        self._file.flush()
+
+    def record(self, kind, register, timestamp=None):
+        """Record the coil register if it changed since the last record of that kind.
+        """
+        if timestamp is None:
+            timestamp = hware.clock()
+        state = register2mask(register)
+        with self._lock:
+            last = self._last[kind]
+            if state == last or self._file.closed:
+                return
+            changed = (1 << self._valve_num) - 1 if last is None else state ^ last
+            self._last[kind] = state
+            self._write(timestamp, kind, state, changed)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class JournalReader(object):
+    """Random access reader of a valve transition journal.
+
+    The journal is memory mapped; the records of each kind are looked up
+    with a binary search on time, without replaying the journal.
+
+    Parameters
+    ----------
+    path : str
+        Journal file.
+
+    valve_num : int
+        Number of valves.
+    """
+    def __init__(self, path, valve_num):
+        self._path = path
+        self._valve_num = valve_num
+        self.refresh()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def origin(self):
+        """Returns the clock time and wall time (seconds since epoch) of the journal start.
+        """
+        origin = self._data[self._data['kind'] == ORIGIN]
+        if not len(origin):
+            return None
+        return origin['time'][0], origin['state'][0] / 1e6
+
+    def refresh(self):
+        """Map records appended since opening.
+        """
+        count = os.path.getsize(self._path) // RECORD.itemsize
+        if count == 0:
+            self._data = np.zeros(0, dtype=RECORD)
+        else:
+            self._data = np.memmap(self._path, dtype=RECORD, mode='r', shape=(count,))
+        self._kinds = {}
+
+    def records(self, kind=CONFIRMED):
+        if kind not in self._kinds:
+            self._kinds[kind] = self._data[self._data['kind'] == kind]
+        return self._kinds[kind]
+
+    def state(self, timestamp, kind=CONFIRMED):
+        """Returns the states of all valves at a clock time, None before the first record.
+        """
+        records = self.records(kind)
+        idx = np.searchsorted(records['time'], timestamp, side='right') - 1
+        if idx < 0:
+            return None
+        return mask2register(records['state'][idx], self._valve_num)
+
+    def transitions(self, num, kind=CONFIRMED):
+        """Returns the times and new states of one valve.
+        """
+        records = self.records(kind)
+        bit = np.uint64(1 << int(num))
+        changes = records[(records['changed'] & bit) != 0]
+        return changes['time'], (changes['state'] & bit) != 0
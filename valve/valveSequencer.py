@@ -0,0 +1,199 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : valveSequencer.py
+# description       : Microfluidic Control - Valve module - Valve pattern sequencer
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module
+# notes             : Do not quick fix functions for specific needs, keep them general!
+# python_version    : 2.7
+
+"""
+Pumps and multiplexers are defined in chipConfig.json next to the valves:
+
+    "pumps": {
+      "Rotary": {
+        "valves": ["Ro0", "Ro1", "Ro2"],
+        "pattern": ["101", "100", "110", "010", "011", "001"],
+        "rate": 20
+      }
+    },
+    "muxes": {
+      "Inputs": {
+        "valves": ["M0", "M1", "M2", "M3"],
+        "addresses": {"Sm": "0101", "Dy": "0110"}
+      }
+    }
+
+Each pattern step or mux address has one character per valve: "1" sets
+the valve (coil on), "0" resets it. Rates are in steps per second.
+"""
+
+# [Modules]
+# General Python
+import warnings
+import threading
+from collections import deque
+# Project
+import hware
+
+# [SETTINGS]
+DEFAULT_RATE = 10  # Steps per second when a pump has no rate
+JITTER_HISTORY = 10000  # Number of step timings kept for the statistics
+
+class Pattern(object):
+    """Valve pattern compiled into coil bitmasks.
+
+    Each step is stored as a bitmask over the coils from the lowest to the
+    highest valve of the pattern, plus a mask of the pattern valves in that
+    range. A step is played with Load.valve_set_many: one write_coils
+    request over the coils that change; coils that are not part of the
+    pattern keep their state.
+
+    Parameters
+    ----------
+    control : wagoWrapper.Load
+        Valve control to resolve valve names.
+
+    valves : list
+        Valve numbers or names, one per pattern character.
+
+    steps : list (of str)
+        Pattern steps, like "101".
+    """
+    def __init__(self, control, valves, steps):
+        nums = [control.index.lookup(v) if isinstance(v, basestring) else int(v) for v in valves]
+        for step in steps:
+            if len(step) != len(nums):
+                raise ValueError("Pattern step '%s' does not match valves %s." % (step, list(valves)))
+        self.valves = nums
+        self.start = min(nums)
+        self.count = max(nums) - self.start + 1
+        self.mask = sum(1 << (num - self.start) for num in nums)
+        self.steps = [sum(1 << (num - self.start) for num, c in zip(nums, step) if c == '1') for step in steps]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __repr__(self):
+        return repr(['{0:0{1}b}'.format(step, self.count)[::-1] for step in self.steps])
+
+    def states(self, step):
+        """Returns the states of the pattern valves for a step, by valve number.
+        """
+        bits = self.steps[step]
+        return dict((self.start + idx, bool((bits >> idx) & 1))
+                    for idx in xrange(self.count) if (self.mask >> idx) & 1)
+
+    @classmethod
+    def pump(cls, control, chip, name):
+        pump = chip['pumps'][name]
+        return cls(control, pump['valves'], pump['pattern'])
+
+    @classmethod
+    def mux(cls, control, chip, name, address):
+        mux = chip['muxes'][name]
+        return cls(control, mux['valves'], [mux['addresses'].get(address, address)])
+
+def mux_select(control, chip, name, address):
+    """Set a multiplexer to an address name or address string with one write.
+
+    Returns whether the mux valves are set, like Load.valve_set_many.
+    """
+    pattern = Pattern.mux(control, chip, name, address)
+    return control.valve_set_many(pattern.states(0))
+
+class Sequencer(threading.Thread):
+    """Valve pattern playback thread.
+
+    Plays a Pattern at a fixed step rate, at most one write_coils request per step,
+    on a timing thread with an absolute schedule: late steps do not shift
+    the steps after them. A step that is more than a full period late is
+    skipped and counted as missed.
+
+    Parameters
+    ----------
+    control : wagoWrapper.Load
+        Valve control.
+
+    pattern : Pattern
+        Compiled valve pattern.
+
+    rate : float
+        Steps per second.
+
+    cycles : int, optional
+        Number of pattern cycles to play, None plays until stop().
+    """
+    def __init__(self, control, pattern, rate=DEFAULT_RATE, cycles=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.control = control
+        self.pattern = pattern
+        self.period = 1 / rate
+        self.cycles = cycles
+        self._stop = threading.Event()
+        self._lateness = deque(maxlen=JITTER_HISTORY)
+        self._steps = 0
+        self._missed = 0
+        self._elapsed = 0
+
+    @classmethod
+    def pump(cls, control, chip, name, rate=None, cycles=None):
+        """Sequencer for a pump defined in the chip configuration.
+        """
+        if rate is None:
+            rate = chip['pumps'][name].get('rate', DEFAULT_RATE)
+        return cls(control, Pattern.pump(control, chip, name), rate, cycles)
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    @property
+    def stats(self):
+        """Returns steps played, missed steps, achieved rate and jitter percentiles in seconds.
+        """
+        stats = {'steps': self._steps, 'missed': self._missed, 'rate': None}
+        if self._elapsed > 0:
+            stats['rate'] = self._steps / self._elapsed
+        stats['jitter'] = hware.percentiles(list(self._lateness))
+        return stats
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        hware.timing_thread(True)
+        try:
+            steps = len(self.pattern)
+            states = [self.pattern.states(step) for step in xrange(steps)]
+            total = None if self.cycles is None else self.cycles * steps
+            tick = 0
+            time_start = hware.clock()
+            while not self._stop.is_set() and (total is None or tick < total):
+                deadline = time_start + tick * self.period
+                hware.sleep_until(deadline)
+                lateness = hware.clock() - deadline
+                if lateness > self.period:
+                    self._missed += 1
+                else:
+                    self.control.valve_set_many(states[tick % steps])
+                    self._lateness.append(lateness)
+                    self._steps += 1
+                tick += 1
+                self._elapsed = hware.clock() - time_start
+        finally:
+            hware.timing_thread(False)
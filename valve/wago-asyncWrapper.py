@@ -0,0 +1,115 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : wago-asyncWrapper.py
+# description       : Microfluidic Control - Wago Control - Pipelined requests
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : Use as module, select with "hardware": "wago-async" in hwareConfig.json
+# notes             : General functions wrapper for flow control. Must be the same for all flow control hardware!
+# python_version    : 2.7
+
+
+# [Modules]
+# General Python
+import warnings
+# Project
+import hware
+import wagoWrapper
+import valveJournal
+
+class Load(wagoWrapper.Load):
+    """Pipelined Wago wrapper for Microfluidics Control
+
+    Same functions as wagoWrapper.Load, plus *_async functions that return
+    the hware.Future of a request without waiting for the reply. Requests are
+    matched to their replies by transaction ID, so several valve requests
+    are in flight on the connection at once. The regular functions wait on
+    these futures, so the GUI and scripts can keep calling them
+    synchronously from any thread.
+
+    Parameters
+    ----------
+    ip : str
+        IP address of WAGO controller.
+
+    valves : int
+        Number valves controlled by WAGO controller.
+
+    reg_addr : int
+        Coil register address.
+
+    window : int, optional
+        Maximum number of Modbus requests in flight. Set in `valving` of
+        hwareConfig.json.
+    """
+    # Base functions
+    def _valve_func_async(self, num, state):
+        if type(num) is str:
+            num = self._name2no(num)
+        future = self._client.write_coil(num, bool(state))
+        self._register[num] = bool(state)
+        self._register_changed(valveJournal.COMMANDED)
+        return future
+
+    def _coils_func_async(self, start, states):
+        future = self._client.write_coils(start, states)
+        self._register[start:start+len(states)] = states
+        self._register_changed(valveJournal.COMMANDED)
+        return future
+
+    def _reg_func_async(self):
+        future = self._client.read_coils(self._reg_addr, self._valve_num)
+        future.add_done_callback(self._reg_done)
+        return future
+
+    def _reg_done(self, future):
+        if future.exception() is None:
+            self._register = future.result()
+            self._verified = hware.clock()
+            self._register_changed(valveJournal.CONFIRMED)
+
+    # Asynchronous functions
+    def wait(self, futures):
+        """Wait for futures of the *_async functions; returns their results.
+
+        A request that times out fails its future and raises ModbusError.
+        """
+        return [self._client.wait(future) for future in futures]
+
+    def valve_read_async(self, num=None):
+        """Returns a future for the hardware state of one or all valves.
+        """
+        if type(num) is str:
+            num = self._name2no(num)
+        future = hware.Future()
+        def done(reg_future):
+            if reg_future.exception() is not None:
+                future.set_exception(reg_future.exception())
+            elif num is None:
+                future.set_result(reg_future.result())
+            else:
+                future.set_result(reg_future.result()[num])
+        self._reg_func_async().add_done_callback(done)
+        return future
+
+    def valve_set_async(self, state=False, num=None):
+        """Returns a future that completes when the valve(s) are written.
+
+        All valves are written with one request if `num` is None.
+        """
+        state = bool(state)
+        if num is not None:
+            return self._valve_func_async(num, state)
+        if self._register is None:
+            self.update()
+        return self._coils_func_async(0, [state] * self._valve_num)
@@ -0,0 +1,74 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : wago-simWrapper.py
+# description       : Microfluidic Control - Wago Control - Simulated controller
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : Use as module, select with "hardware": "wago-sim" in hwareConfig.json
+# notes             : General functions wrapper for flow control. Must be the same for all flow control hardware!
+# python_version    : 2.7
+
+
+# [Modules]
+# General Python
+import warnings
+import importlib
+# Project
+import wagoSim
+
+wago_async = importlib.import_module('valve.wago-asyncWrapper')
+
+class Load(wago_async.Load):
+    """Simulated Wago wrapper for Microfluidics Control
+
+    Starts a local wagoSim.Simulator with the `valving` configuration and
+    controls it over Modbus/TCP like a real controller, so everything above
+    the wrapper runs unchanged without hardware.
+
+    Parameters
+    ----------
+    ip : str
+        IP address to serve the simulator on, normally "127.0.0.1".
+
+    valves : int
+        Number valves of the simulated WAGO controller.
+
+    reg_addr : int
+        Coil register address.
+
+    port : int
+        Port of the simulator, like wagoSim.SIM_PORT. Set in `valving` of
+        hwareConfig.json; the Modbus default 502 needs admin rights.
+
+    sim : dict, optional
+        Simulator settings 'latency', 'jitter' and 'faults', see
+        wagoSim.Simulator. Set in `valving` of hwareConfig.json.
+    """
+    def __init__(self, config):
+        self._simulator = None
+        super(Load, self).__init__(config)
+        sim_config = self._config.hware['valving'].get('sim', {})
+        self._simulator = wagoSim.Simulator(self._valve_num, self._reg_addr, self._ip, self._port, **sim_config)
+
+    @property
+    def simulator(self):
+        return self._simulator
+
+    def connect(self):
+        self._simulator.start()
+        super(Load, self).connect()
+
+    def close(self):
+        super(Load, self).close()
+        if self._simulator is not None:
+            self._simulator.stop()
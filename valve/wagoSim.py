@@ -0,0 +1,175 @@
+# !/usr/bin/env python
+
+# [Future imports]
+# "print" function compatibility between Python 2.x and 3.x
+from __future__ import print_function
+# Use Python 3.x "/" for division in Pyhton 2.x
+from __future__ import division
+
+# [File header]     | Copy and edit for each file in this project!
+# title             : wagoSim.py
+# description       : Microfluidic Control - Valve module - Wago Modbus/TCP simulator
+# author            : Bjorn Harink
+# credits           : Kurt Thorn, Huy Nguyen
+# date              : 20261018
+# version update    : 20261018
+# version           : v0.4.0
+# usage             : As module, or as hardware profile with "hardware": "wago-sim" in hwareConfig.json
+# notes             : Simulates the coil functions used for valving only.
+# python_version    : 2.7
+
+# [Modules]
+# General Python
+import time
+import random
+import warnings
+import socket
+import struct
+import threading
+# IO
+import modbusTcp
+
+# [SETTINGS]
+SIM_PORT = 5020  # Unprivileged default port for the simulator
+ILLEGAL_ADDRESS = 0x02
+DEVICE_FAILURE = 0x04
+
+class Simulator(threading.Thread):
+    """Modbus/TCP server simulating a Wago valve controller
+
+    Coils 0 to `valve_num` - 1 are written by the valve functions and read
+    back from `reg_addr`, like the process image of the Wago controller.
+
+    Parameters
+    ----------
+    valve_num : int
+        Number of valves (coils).
+
+    reg_addr : int
+        Coil register address for reading the coils back.
+
+    latency : float
+        Seconds added to every request.
+
+    jitter : float
+        Maximum seconds randomly added to or removed from the latency.
+
+    faults : dict
+        Probabilities per request of the faults: 'error', a Modbus exception
+        reply; 'silent', no reply at all; 'drop', closing the connection.
+    """
+    def __init__(self, valve_num, reg_addr, host='127.0.0.1', port=SIM_PORT, latency=0, jitter=0, faults=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._valve_num = valve_num
+        self._reg_addr = reg_addr
+        self._host = host
+        self._port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.faults = dict(faults or {})
+        self.coils = [False] * valve_num
+        self.requests = 0
+        self._server = None
+        self._halt = threading.Event()
+
+    def __repr__(self):
+        return 'Wago simulator %s:%s' % (self._host, self._port)
+
+    @property
+    def address(self):
+        return self._host, self._port
+
+    def start(self):
+        """Start serving; returns when the simulator accepts connections.
+        """
+        if self._server is None:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind((self._host, self._port))
+            self._server.listen(5)
+            threading.Thread.start(self)
+
+    def stop(self):
+        self._halt.set()
+        if self._server is not None:
+            self._server.close()
+
+    # Base functions
+    def _fault(self, name):
+        return random.random() < self.faults.get(name, 0)
+
+    def _delay(self):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _coil_slice(self, address, count):
+        if address >= self._reg_addr:
+            address -= self._reg_addr
+        if address + count > self._valve_num:
+            return None
+        return slice(address, address + count)
+
+    def _reply(self, pdu):
+        function = bytearray(pdu[:1])[0]
+        if self._fault('error'):
+            return struct.pack('>BB', function | modbusTcp.EXCEPTION_FLAG, DEVICE_FAILURE)
+        if function == modbusTcp.READ_COILS:
+            address, count = struct.unpack('>HH', pdu[1:5])
+            coils = self._coil_slice(address, count)
+            if coils is not None:
+                data = modbusTcp.pack_bits(self.coils[coils])
+                return struct.pack('>BB', function, len(data)) + data
+        elif function == modbusTcp.WRITE_COIL:
+            address, value = struct.unpack('>HH', pdu[1:5])
+            coils = self._coil_slice(address, 1)
+            if coils is not None:
+                self.coils[coils] = [value == 0xFF00]
+                return pdu[:5]
+        elif function == modbusTcp.WRITE_COILS:
+            address, count = struct.unpack('>HH', pdu[1:5])
+            coils = self._coil_slice(address, count)
+            if coils is not None:
+                self.coils[coils] = modbusTcp.unpack_bits(pdu[6:], count)
+                return pdu[:5]
+        return struct.pack('>BB', function | modbusTcp.EXCEPTION_FLAG, ILLEGAL_ADDRESS)
+
+    def _recv(self, client, size):
+        data = b''
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                raise socket.error('Client disconnected.')
+            data += chunk
+        return data
+
+    def _serve(self, client):
+        try:
+            while not self._halt.is_set():
+                tid, protocol, length, unit = struct.unpack(modbusTcp.MBAP_HEADER, self._recv(client, modbusTcp.MBAP_SIZE))
+                pdu = self._recv(client, length - 1)
+                self.requests += 1
+                self._delay()
+                if self._fault('drop'):
+                    break
+                if self._fault('silent'):
+                    continue
+                client.sendall(modbusTcp.frame(tid, self._reply(pdu), unit))
+        except (socket.error, struct.error):
+            pass
+        finally:
+            client.close()
+
+    def run(self):
+        """Overrides Thread.run. Don't call this directly its called internally when you call Thread.start()
+        """
+        while not self._halt.is_set():
+            try:
+                client, address = self._server.accept()
+            except socket.error:
+                break
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            handler = threading.Thread(target=self._serve, args=(client,))
+            handler.daemon = True
+            handler.start()
@@ -12,7 +12,7 @@ from __future__ import division
 # author            : Bjorn Harink
 # credits           : Kurt Thorn, Huy Nguyen
 # date              : 20150901
-# version update    : 20160808
+# version update    : 20261018
 # version           : v0.4.0
 # usage             : Use as module
 # notes             : General functions wrapper for flow control. Must be the same for all flow control hardware!
@@ -21,10 +21,20 @@ from __future__ import division
 
 # [Modules]
 # General Python
+import os
+import time
 import warnings
+import threading
 # IO
-from pymodbus.client.sync import ModbusTcpClient as ModbusClient
-from pymodbus.pdu import ModbusRequest
+import modbusTcp
+# Project
+import hware
+import valveIndex
+import valveJournal
+
+# [SETTINGS]
+VERIFY_TIME = 1.0  # Maximum age in seconds of the register shadow before it is read from hardware
+CLIENT = 'modbus'  # Modbus client, 'modbus' or 'pymodbus'
 
 class Load(object):
     """Wago wrapper for Microfluidics Control
@@ -39,15 +49,53 @@ class Load(object):
 
     reg_addr : int
         Coil register address.
+
+    verify : float, optional
+        Maximum age in seconds of the local register shadow before it is
+        verified against the hardware. Set in `valving` of hwareConfig.json;
+        0 reads the hardware on every access.
+
+    window : int, optional
+        Maximum number of Modbus requests in flight. Set in `valving` of
+        hwareConfig.json.
+
+    port : int, optional
+        Modbus/TCP port of the WAGO controller. Set in `valving` of
+        hwareConfig.json.
+
+    journal : str, optional
+        Folder for valve transition journals, one per connection. Set in
+        `valving` of hwareConfig.json; no journal is kept if not set.
+
+    client : str, optional
+        Modbus client: 'modbus' (default) for modbusTcp.Connection, with
+        pipelining, keepalive and reconnect, or 'pymodbus' for the pymodbus
+        sync client. Set in `valving` of hwareConfig.json.
     """
     def __init__(self, config):
         self._config = config
         self._ip = self._config.hware['valving']['config'][0]
         self._valve_num = self._config.hware['valving']['config'][1]
         self._reg_addr = self._config.hware['valving']['config'][2]
-        self._names = self._config.chip['valves']
-        self._client = ModbusClient(self._ip)
+        self._index = valveIndex.ValveIndex(self._config.chip)
+        self._port = self._config.hware['valving'].get('port', modbusTcp.MODBUS_PORT)
+        window = self._config.hware['valving'].get('window', modbusTcp.WINDOW)
+        client = self._config.hware['valving'].get('client', CLIENT)
+        if client == 'pymodbus':
+            self._client = modbusTcp.SyncConnection(self._ip, self._port)
+        elif client == 'modbus':
+            self._client = modbusTcp.Connection(self._ip, self._port, window=window)
+        else:
+            raise ValueError("Modbus client must be 'modbus' or 'pymodbus': %s" % client)
+        self._verify_time = self._config.hware['valving'].get('verify', VERIFY_TIME)
+        self._journal_folder = self._config.hware['valving'].get('journal')
+        self._journal = None
+        self._subscribers = []
+        self._published = None
+        self._publish_lock = threading.Lock()
         self._register = None
+        self._verified = None
+        self._latency = None
 
     def __repr__(self):
         """Returns Modbus client of the WAGO controller.
@@ -69,9 +117,44 @@ class Load(object):
     def status(self):
         return self._register
 
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def verified(self):
+        """Returns the clock time of the last hardware read of the register.
+        """
+        return self._verified
+
+    @property
+    def staleness(self):
+        """Returns the age in seconds of the register shadow.
+        """
+        if self._verified is None:
+            return None
+        return hware.clock() - self._verified
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @property
+    def health(self):
+        """Returns connection counters: reconnects, failed transactions and RTT percentiles.
+        """
+        return self._client.stats
+
+    @property
+    def latency(self):
+        """Returns the latency in seconds of the last multi-valve commit.
+        """
+        return self._latency
+
     def connect(self):
         output = self._client.connect()
         if output is True:
+            self._journal_open()
             self.update()
             self.valve_set(False)
             print('Valve hardware connected to IP %s and initialized.' % self._ip)
@@ -80,37 +163,99 @@ class Load(object):
 
     def close(self):
         try:
-            wago_check = self._client.socket
-            if wago_check is True:
+            if self._client.connected:
                 self._client.close()
                 print('Valve hardware connection closed.')
             else:
                 print('Valve hardware not initialized.')
         except IOError:
             print('Valve hardware connection error: %s' % self._client)
+        if self._journal is not None:
+            self._journal.close()
 
     # Base functions
+    def _journal_open(self):
+        if self._journal_folder is None:
+            return
+        if not os.path.exists(self._journal_folder):
+            os.makedirs(self._journal_folder)
+        file_name = time.strftime('valves_%Y%m%d_%H%M%S.journal')
+        self._journal = valveJournal.Journal(os.path.join(self._journal_folder, file_name), self._valve_num)
+        print('Valve journal: %s' % self._journal.path)
+
+    def _register_changed(self, kind):
+        """Journal the register and publish the valves that changed.
+        """
+        if self._journal is not None:
+            self._journal.record(kind, self._register)
+        if not self._subscribers:
+            return
+        with self._publish_lock:
+            register = list(self._register)
+            if self._published is None:
+                changes = dict(enumerate(register))
+            else:
+                changes = dict((num, state) for num, (state, old) in enumerate(zip(register, self._published)) if state != old)
+            self._published = register
+        if changes:
+            for func in list(self._subscribers):
+                self._notify(func, changes)
+
+    def _notify(self, func, changes):
+        # The valves already changed: a failing subscriber must not fail the valve call
+        try:
+            func(changes)
+        except Exception as e:
+            warnings.warn('Valve subscriber %r failed: %s' % (func, e))
+
     def _name2no(self, name):
-        valve_name = name[1:-1]
-        for valve_no in self._names:
-            if valve_name in self.valves_data[valve_no]['name']:
-                return int(valve_no)
+        return self._index.lookup(name)
 
     def _valve_func(self, num, state):
         if type(num) is str:
             num = self._name2no(num)
-        self._client.write_coil(num, bool(state))
+        self._client.wait(self._client.write_coil(num, bool(state)))
+        self._register[num] = bool(state)
+        self._register_changed(valveJournal.COMMANDED)
+
+    def _coils_func(self, start, states):
+        self._client.wait(self._client.write_coils(start, states))
+        self._register[start:start+len(states)] = states
+        self._register_changed(valveJournal.COMMANDED)
 
     def _reg_func(self):
-        reg_read = self._client.read_coils(self._reg_addr, self._valve_num)
-        return reg_read.bits
+        return self._client.wait(self._client.read_coils(self._reg_addr, self._valve_num))
+
+    def _coil_range(self, states):
+        """Returns the smallest contiguous coil range holding all changes.
+
+        Coils inside the range that do not change are filled from the current
+        register image, so the whole range can be written with one request.
+        """
+        changed = [num for num, state in states.items() if self._register[num] != state]
+        if not changed:
+            return None, []
+        start = min(changed)
+        stop = max(changed) + 1
+        return start, [states.get(num, self._register[num]) for num in xrange(start, stop)]
 
     # Minimum functions
-    def update(self):
-        self._register = self._reg_func()
+    def update(self, verify=False):
+        """Read the register from hardware if forced or the shadow is stale.
+        """
+        staleness = self.staleness
+        if verify or (staleness is None) or (staleness >= self._verify_time):
+            self._register = self._reg_func()
+            self._verified = hware.clock()
+            self._register_changed(valveJournal.CONFIRMED)
 
-    def valve_read(self, num=None):
-        self.update()
+    def verify(self):
+        """Verify the register shadow against the hardware.
+        """
+        self.update(verify=True)
+
+    def valve_read(self, num=None, verify=False):
+        self.update(verify)
         if type(num) is str:
             num = self._name2no(num)
         if num is None: 
@@ -118,31 +263,91 @@ class Load(object):
         else: 
             return self._register[num]
 
-    def valve_check(self, state, num=None):
-        valve_read = self.valve_read(num)
+    def valve_check(self, state, num=None, verify=False):
+        valve_read = self.valve_read(num, verify)
         if state == valve_read:
             return True
         else:
             return False
 
-    def valve_set(self, state=False, num=None):
+    def valve_set(self, state=False, num=None, verify=False):
+        """Set one or, if num is None, all valves.
+
+        Returns whether the valves are in state: by the register shadow,
+        which a write updates, unless verify is True or the shadow is stale,
+        then by the coils read back from hardware.
+        """
         state = bool(state)
         if num is None:
-            [self._valve_func(valve, state) for valve in xrange(self._valve_num)]
-            state = [state] * self._valve_num
+            return self.valve_set_many(xrange(self._valve_num), state, verify)
         else:
             self._valve_func(num, state)
-        return self.valve_check(state, num)
+        return self.valve_check(state, num, verify)
+
+    def valve_set_many(self, valves, state=False, verify=False):
+        """Set multiple valves with one Modbus write_coils request.
+
+        Returns whether the valves are in their states, like valve_set.
+
+        Parameters
+        ----------
+        valves : dict, list
+            Dictionary of valve numbers or names to states, or a list of valve
+            numbers or names which are all set to `state`.
+
+        state : bool
+            State for the valves when `valves` is a list.
+
+        verify : bool
+            Read the coils back from hardware for the result.
+        """
+        if not isinstance(valves, dict):
+            valves = dict.fromkeys(valves, state)
+        states = {}
+        for num, value in valves.items():
+            if type(num) is str:
+                num = self._name2no(num)
+            states[int(num)] = bool(value)
+        self.update()
+        start, coils = self._coil_range(states)
+        time_start = hware.clock()
+        if coils:
+            self._coils_func(start, coils)
+        self._latency = hware.clock() - time_start
+        self.update(verify)
+        return all(self._register[num] == value for num, value in states.items())
 
     def valve_switch(self, num):
         wago_read = self.valve_read(num)
-        if wago_read is True: valve_set(num, False)
-        elif wago_read is False: valve_set(num, True)
+        if wago_read is True: self.valve_set(False, num)
+        elif wago_read is False: self.valve_set(True, num)
+
+    def subscribe(self, func):
+        """Call func(changes) with a dictionary of valve numbers to new states
+        whenever valves change. Called on the thread that changed the valves.
+        """
+        if func in self._subscribers:
+            return
+        self._subscribers.append(func)
+        if self._register is not None:
+            with self._publish_lock:
+                self._published = list(self._register)
+            self._notify(func, dict(enumerate(self._published)))
+
+    def unsubscribe(self, func):
+        if func in self._subscribers:
+            self._subscribers.remove(func)
+
+    def valve_rename(self, num, name):
+        """Rename a valve in the chip configuration and the name index.
+        """
+        self._config.chip['valves']["%02d" % int(num)]['name'] = name
+        self._index.rename(num, name)
 
     # Courtesy functions
-    def valve_on(self, num=None):
-        return self.valve_set(num, True)
+    def valve_on(self, num=None, verify=False):
+        return self.valve_set(True, num, verify)
 
-    def valve_off(self, num=None):
-        return self.valve_set(num, False)
+    def valve_off(self, num=None, verify=False):
+        return self.valve_set(False, num, verify)
 